@@ -0,0 +1,65 @@
+"""
+Per-message cost of decoding gzip websocket frames with each installed json backend.
+
+Usage:
+    codec.py [--frames=<path>] [--count=<n>] [--depth=<n>]
+
+Options:
+    --frames=<path>  recorded messages, one json message per line, synthetic tick-v3 frames if omitted
+    --count=<n>      synthetic frames to generate [default: 5000]
+    --depth=<n>      book levels per side in synthetic snapshots [default: 50]
+"""
+import gzip
+import json
+import random
+import time
+
+from docopt import docopt
+
+from onetoken import codec
+
+
+def synthetic_messages(count, depth):
+    random.seed(3)
+    messages = []
+    for i in range(count):
+        tp = 's' if i % 100 == 0 else 'd'
+        n = depth if tp == 's' else 3
+        messages.append({'c': 'okef/btc.usd.q', 'tp': tp, 'tm': 1546300800.123 + i * 0.01,
+                         'et': 1546300800.1 + i * 0.01, 'l': 3700.5, 'v': 123456, 'vc': 33.3,
+                         'b': [[round(3700 - random.random() * 50, 1), random.randint(0, 500)] for _ in range(n)],
+                         'a': [[round(3701 + random.random() * 50, 1), random.randint(0, 500)] for _ in range(n)]})
+    return messages
+
+
+def bench(name, decode, frames):
+    bg = time.perf_counter()
+    for frame in frames:
+        decode(frame)
+    cost = time.perf_counter() - bg
+    print(f'{name:16s} {cost / len(frames) * 1e6:8.2f} us/frame')
+
+
+def main():
+    args = docopt(__doc__)
+    if args['--frames']:
+        with open(args['--frames']) as f:
+            messages = [json.loads(line) for line in f if line.strip()]
+    else:
+        messages = synthetic_messages(int(args['--count']), int(args['--depth']))
+    frames = [gzip.compress(json.dumps(m).encode()) for m in messages]
+    print(f'{len(frames)} frames, {sum(len(f) for f in frames) / len(frames):.0f} bytes/frame compressed')
+
+    bench('gzip+json (old)', lambda data: json.loads(gzip.decompress(data).decode()), frames)
+    for name in codec.BACKENDS:
+        try:
+            codec.set_backend(name)
+        except ImportError:
+            print(f'{name:16s} not installed')
+            continue
+        bench(name, codec.decode_frame, frames)
+    codec.set_backend()
+
+
+if __name__ == '__main__':
+    main()
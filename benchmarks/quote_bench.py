@@ -0,0 +1,230 @@
+"""
+Benchmark the quote path against a local synthetic exchange.
+
+A websocket server speaking the tick, tick-v3 (snapshot + delta), candle and zhubi protocols runs in a child
+process and pushes gzip frames at a fixed rate. TickQuote / TickV3Quote / CandleQuote / ZhubiQuote connect to it
+and the report has messages/sec, client CPU per message, event loop lag and end-to-end latency percentiles.
+
+Usage:
+    quote_bench.py [--channels=<list>] [--rate=<n>] [--seconds=<n>] [--contracts=<n>] [--depth=<n>]
+                   [--output=<path>]
+
+Options:
+    --channels=<list>  comma separated channels [default: tick,tick-v3,candle,zhubi]
+    --rate=<n>         messages per second pushed by the server [default: 2000]
+    --seconds=<n>      duration of each run [default: 5]
+    --contracts=<n>    number of subscribed contracts [default: 20]
+    --depth=<n>        book levels per side [default: 20]
+    --output=<path>    write the json report to a file as well as stdout
+"""
+import asyncio
+import gzip
+import json
+import multiprocessing
+import random
+import time
+from datetime import datetime, timezone
+
+from docopt import docopt
+
+import onetoken
+from onetoken import quote
+from onetoken.replay import QuoteServer
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SyntheticExchange(QuoteServer):
+    def __init__(self, channel, depth):
+        super().__init__()
+        self.channel = channel
+        self.depth = depth
+        self.seq = 0
+
+    def snapshot(self, contract):
+        now = time.time()
+        return {'c': contract, 'tp': 's', 'tm': now, 'et': now, 'l': 100.0, 'v': 0, 'vc': 0,
+                'b': [[round(100 - i * 0.1, 1), 1] for i in range(self.depth)],
+                'a': [[round(100.1 + i * 0.1, 1), 1] for i in range(self.depth)]}
+
+    def on_subscribe(self, ws, data):
+        if self.channel == 'tick-v3':
+            frame = gzip.compress(json.dumps(self.snapshot(data['contract'])).encode())
+            asyncio.ensure_future(ws.send_bytes(frame))
+
+    def message(self, contract):
+        self.seq += 1
+        r = random.random
+        if self.channel == 'tick-v3':
+            now = time.time()
+            return {'c': contract, 'tp': 'd', 'tm': now, 'et': now, 'l': 100.0, 'v': self.seq, 'vc': self.seq,
+                    'b': [[round(100 - int(r() * self.depth) * 0.1, 1), int(r() * 5)] for _ in range(2)],
+                    'a': [[round(100.1 + int(r() * self.depth) * 0.1, 1), int(r() * 5)] for _ in range(2)]}
+        if self.channel == 'tick':
+            now = iso_now()
+            return {'uri': 'single-tick-verbose',
+                    'data': {'contract': contract, 'time': now, 'exchange_time': now, 'last': 100.0,
+                             'volume': self.seq,
+                             'bids': [{'price': round(100 - i * 0.1, 1), 'volume': 1} for i in range(self.depth)],
+                             'asks': [{'price': round(100.1 + i * 0.1, 1), 'volume': 1} for i in range(self.depth)]}}
+        if self.channel == 'candle':
+            return {'uri': 'single-candle',
+                    'data': {'contract': contract, 'duration': '1m', 'time': iso_now(), 'open': 100, 'high': 101,
+                             'low': 99, 'close': 100.5, 'volume': self.seq, 'amount': self.seq}}
+        now = iso_now()
+        return {'uri': 'single-zhubi-verbose',
+                'data': [{'contract': contract, 'time': now, 'exchange_time': now, 'price': 100.0, 'amount': 1,
+                          'bs': 'b' if r() > 0.5 else 's'} for _ in range(3)]}
+
+    async def push(self, contracts, rate):
+        await self.subscribed.wait()
+        # give the client time to subscribe every contract
+        await asyncio.sleep(1)
+        interval = 0.005
+        per_tick = rate * interval
+        budget = 0.0
+        next_at = time.monotonic()
+        i = 0
+        while True:
+            budget += per_tick
+            while budget >= 1:
+                budget -= 1
+                contract = contracts[i % len(contracts)]
+                i += 1
+                await self.broadcast(self.message(contract))
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+
+def run_server(channel, depth, contracts, rate, port_q):
+    async def main():
+        server = SyntheticExchange(channel, depth)
+        await server.start()
+        port_q.put(server.port)
+        await server.push(contracts, rate)
+
+    asyncio.new_event_loop().run_until_complete(main())
+
+
+def percentiles(values, scale=1.0):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * scale, 3)
+
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'p999': pick(0.999),
+            'max': round(values[-1] * scale, 3)}
+
+
+def sent_time(item):
+    if isinstance(item, list):
+        item = item[0]
+    tm = item.exchange_time if hasattr(item, 'exchange_time') and item.exchange_time else item.time
+    if isinstance(tm, float):
+        return tm
+    if hasattr(tm, 'float_timestamp'):
+        return tm.float_timestamp
+    return tm.timestamp()
+
+
+async def run_client(channel, url, contracts, seconds):
+    if channel == 'tick':
+        q = quote.TickQuote('bench')
+    elif channel == 'tick-v3':
+        q = quote.TickV3Quote('bench')
+    elif channel == 'candle':
+        q = quote.CandleQuote('bench')
+    else:
+        q = quote.ZhubiQuote('bench')
+    q.ws_url = url
+
+    count = 0
+    latency = []
+    measuring = False
+
+    def on_update(item):
+        nonlocal count
+        if measuring:
+            count += 1
+            latency.append(time.time() - sent_time(item))
+
+    for contract in contracts:
+        if channel == 'tick':
+            await q.subscribe_tick(contract, on_update)
+        elif channel == 'tick-v3':
+            await q.subscribe_tick_v3(contract, on_update)
+        elif channel == 'candle':
+            await q.subscribe_candle(contract, '1m', on_update)
+        else:
+            await q.subscribe_zhubi(contract, on_update)
+    await asyncio.sleep(1.5)
+
+    lag = []
+
+    async def probe():
+        while True:
+            bg = time.monotonic()
+            await asyncio.sleep(0.01)
+            lag.append(time.monotonic() - bg - 0.01)
+
+    probe_task = asyncio.ensure_future(probe())
+    measuring = True
+    cpu0, wall0 = time.process_time(), time.monotonic()
+    await asyncio.sleep(seconds)
+    cpu1, wall1 = time.process_time(), time.monotonic()
+    measuring = False
+    probe_task.cancel()
+    await q.close()
+
+    wall = wall1 - wall0
+    return {'messages': count,
+            'msgs_per_sec': round(count / wall, 1),
+            'cpu_us_per_msg': round((cpu1 - cpu0) / count * 1e6, 2) if count else None,
+            'cpu_utilization': round((cpu1 - cpu0) / wall, 3),
+            'loop_lag_ms': percentiles(lag, 1e3),
+            'latency_ms': percentiles(latency, 1e3)}
+
+
+def bench(channel, rate, seconds, n_contracts, depth):
+    contracts = [f'bench/coin{i}.usdt' for i in range(n_contracts)]
+    port_q = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=run_server, args=(channel, depth, contracts, rate, port_q), daemon=True)
+    proc.start()
+    try:
+        port = port_q.get(timeout=10)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        result = loop.run_until_complete(run_client(channel, f'ws://127.0.0.1:{port}/', contracts, seconds))
+        loop.close()
+    finally:
+        proc.terminate()
+        proc.join()
+    return result
+
+
+def main():
+    args = docopt(__doc__)
+    onetoken.log_level('WARNING')
+    rate = int(args['--rate'])
+    seconds = float(args['--seconds'])
+    n_contracts = int(args['--contracts'])
+    depth = int(args['--depth'])
+    report = {'sdk_version': onetoken.__version__,
+              'codec': onetoken.codec.BACKEND,
+              'params': {'rate': rate, 'seconds': seconds, 'contracts': n_contracts, 'depth': depth},
+              'results': {}}
+    for channel in args['--channels'].split(','):
+        report['results'][channel] = bench(channel, rate, seconds, n_contracts, depth)
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args['--output']:
+        with open(args['--output'], 'w') as f:
+            f.write(out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Per-request cost of signing an order request, gen_sign against the precomputed account Signer.
+
+Usage:
+    sign.py [--count=<n>]
+
+Options:
+    --count=<n>  requests signed by each method [default: 100000]
+"""
+import json
+import time
+
+from docopt import docopt
+
+from onetoken import account
+
+SECRET = 'this-is-long-secret-of-the-account-0123456789'
+ORDER = {'contract': 'okex/btc.usdt', 'price': 3712.5, 'bs': 'b', 'amount': 0.25, 'client_oid': 'okex-demo-12345'}
+
+
+def bench_gen_sign(count):
+    bg = time.perf_counter()
+    for _ in range(count):
+        nonce = account.gen_nonce()
+        json_str = json.dumps(ORDER)
+        sign = account.gen_sign(SECRET, 'POST', '/{}/{}{}'.format('okex', 'demo', '/orders'), nonce, json_str)
+        {'Api-Nonce': str(nonce), 'Api-Key': 'key', 'Api-Signature': sign, 'Content-Type': 'application/json'}
+    return time.perf_counter() - bg
+
+
+def bench_signer(count):
+    signer = account.Signer(SECRET, 'key', '/okex/demo')
+    bg = time.perf_counter()
+    for _ in range(count):
+        body = account.dump_body(ORDER)
+        signer.headers('POST', '/orders', body)
+    return time.perf_counter() - bg
+
+
+def main():
+    args = docopt(__doc__)
+    count = int(args['--count'])
+    for name, func in [('gen_sign', bench_gen_sign), ('Signer', bench_signer)]:
+        seconds = func(count)
+        print(f'{name:10} {seconds / count * 1e6:8.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
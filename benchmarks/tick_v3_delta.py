@@ -0,0 +1,110 @@
+"""
+Compare the cost of applying tick-v3 deltas: the old copy + merge + re-sort path against the OrderBook path.
+
+Usage:
+    tick_v3_delta.py [--depth=<n>] [--deltas=<n>] [--changes=<n>] [--read=<ratio>]
+
+Options:
+    --depth=<n>      levels per side in the snapshot [default: 200]
+    --deltas=<n>     number of deltas to apply [default: 20000]
+    --changes=<n>    levels changed per side in each delta [default: 3]
+    --read=<ratio>   fraction of ticks whose bids/asks are read by the callback [default: 0.1]
+"""
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from docopt import docopt
+
+from onetoken.model import Tick
+from onetoken.orderbook import OrderBook
+
+
+def legacy_apply(tick, data):
+    # the path TickV3Quote used before the OrderBook
+    tick = Tick(time=tick.time, price=tick.price, volume=tick.volume,
+                bids=json.loads(json.dumps(tick.bids)), asks=json.loads(json.dumps(tick.asks)),
+                contract=tick.contract, source=tick.source, exchange_time=tick.exchange_time, amount=tick.amount)
+    bids = {p: v for p, v in data['b']}
+    old_bids = {item['price']: item['volume'] for item in tick.bids}
+    old_bids.update(bids)
+    bids = [{'price': p, 'volume': v} for p, v in old_bids.items() if v > 0]
+    tick.bids = sorted(bids, key=lambda x: x['price'], reverse=True)
+    asks = {p: v for p, v in data['a']}
+    old_asks = {item['price']: item['volume'] for item in tick.asks}
+    old_asks.update(asks)
+    asks = [{'price': p, 'volume': v} for p, v in old_asks.items() if v > 0]
+    tick.asks = sorted(asks, key=lambda x: x['price'])
+    return tick
+
+
+def gen_deltas(depth, count, changes):
+    random.seed(7)
+    deltas = []
+    for _ in range(count):
+        # most of the activity is near the top of the book
+        b = [[round(10000 - min(random.expovariate(0.2), depth - 1) * 0.5, 1), random.choice([0, 1, 2, 5])]
+             for _ in range(changes)]
+        a = [[round(10000.5 + min(random.expovariate(0.2), depth - 1) * 0.5, 1), random.choice([0, 1, 2, 5])]
+             for _ in range(changes)]
+        deltas.append({'b': b, 'a': a})
+    return deltas
+
+
+def run(name, apply, first, deltas, read_every):
+    tick = first
+    bg = time.perf_counter()
+    for i, delta in enumerate(deltas):
+        tick = apply(tick, delta)
+        if i % read_every == 0:
+            assert tick.bids and tick.asks
+    cost = time.perf_counter() - bg
+
+    # memory allocated while producing each tick, and memory still held when callbacks retain every tick
+    retained = [tick]
+    transient = 0
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for delta in deltas[:1000]:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        tick = apply(tick, delta)
+        _, peak = tracemalloc.get_traced_memory()
+        transient += peak - current
+        retained.append(tick)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = min(len(deltas), 1000)
+    print(f'{name:8s} {cost / len(deltas) * 1e6:8.2f} us/delta  {transient / n:10.1f} bytes allocated/delta  '
+          f'{(held - base) / n:10.1f} bytes retained/delta')
+
+
+def main():
+    args = docopt(__doc__)
+    depth = int(args['--depth'])
+    count = int(args['--deltas'])
+    changes = int(args['--changes'])
+    read_every = max(1, int(1 / max(float(args['--read']), 1e-9)))
+
+    now = datetime.now(timezone.utc)
+    bids = [[round(10000 - i * 0.5, 1), 1] for i in range(depth)]
+    asks = [[round(10000.5 + i * 0.5, 1), 1] for i in range(depth)]
+    deltas = gen_deltas(depth, count, changes)
+
+    first = Tick(now, 10000, 0, [{'price': p, 'volume': v} for p, v in bids],
+                 [{'price': p, 'volume': v} for p, v in asks], 'bench/btc.usd', 'tick.v3')
+    run('legacy', legacy_apply, first, deltas, read_every)
+
+    book = OrderBook(bids, asks)
+
+    def book_apply(tick, data):
+        book.update(data['b'], data['a'])
+        return Tick.from_book(now, 10000, 0, book, 'bench/btc.usd', 'tick.v3')
+
+    run('book', book_apply, Tick.from_book(now, 10000, 0, book, 'bench/btc.usd', 'tick.v3'), deltas, read_every)
+
+
+if __name__ == '__main__':
+    main()
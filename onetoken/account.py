@@ -2,6 +2,7 @@ import asyncio
 import hashlib
 import hmac
 import json
+import numbers
 import time
 import urllib.parse
 from datetime import datetime
@@ -11,10 +12,15 @@ import aiohttp
 import jwt
 
 from . import autil
+from . import codec
+from . import ratelimit
 from . import util
 from .config import Config
+from .batcher import OidBatcher
 from .logger import log
 from .model import Info, Order
+from .orderstore import OrderStore
+from .rpcutil import Code, HTTPError
 
 
 def get_trans_host(exg):
@@ -61,6 +67,76 @@ def gen_sign(secret, verb, url, nonce, data_str):
     return signature
 
 
+def _json_default(obj):
+    # numpy scalars, e.g. a price computed with numpy
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dump_body(data):
+    """
+    request body of data, stdlib json so the signed bytes stay the same whether orjson is installed or not
+
+    :raise TypeError: data is not serializable
+    :raise ValueError: data contains nan or inf
+    """
+    return bytes(json.dumps(data, default=_json_default, allow_nan=False), 'utf8')
+
+
+class Signer:
+    """
+    gen_sign of one account with the per account work done once: the keyed hmac is copied instead of re-keyed,
+    signed paths are cached per endpoint and the message is assembled as bytes
+
+        signer = Signer(secret, key, '/okex/demo')
+        signer.sign('GET', '/info', nonce, b'') == gen_sign(secret, 'GET', '/okex/demo/info', nonce, None)
+    """
+    MAX_PATHS = 1024
+
+    def __init__(self, secret, api_key, prefix):
+        """
+
+        :param secret: ot-secret
+        :param api_key: ot-key
+        :param prefix: path signed before each endpoint, /{exchange}/{name}
+        """
+        self.secret = secret
+        self.api_key = api_key
+        self.prefix = prefix
+        self.mac = hmac.new(bytes(secret, 'utf8'), digestmod=hashlib.sha256)
+        self.paths = {}
+        self.verbs = {}
+
+    def path(self, endpoint):
+        path = self.paths.get(endpoint)
+        if path is None:
+            if len(self.paths) >= self.MAX_PATHS:
+                self.paths = {}
+            path = self.paths[endpoint] = bytes(urllib.parse.urlparse(self.prefix + endpoint).path, 'utf8')
+        return path
+
+    def sign(self, verb, endpoint, nonce, body=b''):
+        """
+        :param verb: upper case http method
+        :param endpoint: /orders
+        :param nonce: str
+        :param body: bytes sent as request body
+        :return: hex signature
+        """
+        verb_bytes = self.verbs.get(verb)
+        if verb_bytes is None:
+            verb_bytes = self.verbs[verb] = bytes(verb, 'utf8')
+        mac = self.mac.copy()
+        mac.update(b''.join((verb_bytes, self.path(endpoint), bytes(nonce, 'utf8'), body)))
+        return mac.hexdigest()
+
+    def headers(self, verb, endpoint, body=b''):
+        nonce = gen_nonce()
+        return {'Api-Nonce': nonce, 'Api-Key': self.api_key, 'Api-Signature': self.sign(verb, endpoint, nonce, body),
+                'Content-Type': 'application/json'}
+
+
 IDLE = 'idle'
 GOING_TO_CONNECT = 'going-to-connect'
 CONNECTING = 'connecting'
@@ -69,14 +145,23 @@ GOING_TO_DICCONNECT = 'going-to-disconnect'
 
 
 class Account:
-    def __init__(self, symbol: str, api_key=None, api_secret=None, session=None, loop=None):
+    # server endpoint taking a list of orders, place_orders sends one request per order when None
+    BATCH_ORDERS_ENDPOINT = None
+    BATCH_ORDERS_SIZE = 20
+    # seconds without tokens after the server answered ACCOUNT_TOO_FREQUENT
+    TOO_FREQUENT_BACKOFF = 1.0
+    # seconds a watched order may go without any push before its on_update is dropped
+    ORDER_WATCH_TTL = 3600
+
+    def __init__(self, symbol: str, api_key=None, api_secret=None, session=None, loop=None, rate_limits=None):
         """
 
         :param symbol:  account symbol, binance/test_user1
         :param api_key:  ot-key in 1token
         :param api_secret: ot-secret in 1token
-        :param session: support specified http session
-        :param loop:
+        :param session: support specified http session, by default every request uses autil.get_aiohttp_session
+        :param loop: ignored, kept for compatibility, requests run on the current event loop
+        :param rate_limits: {family: (rate, burst)} of ratelimit.RateLimiter, ratelimit.limits_for(exchange) if None
         """
         self.symbol = symbol
         if api_key is None and api_secret is None:
@@ -91,12 +176,14 @@ class Account:
             self.margin_contract = f'{self.exchange}/{margin_contract}'
         else:
             self.margin_contract = None
+        self._signer = None
+        limits = rate_limits if rate_limits is not None else ratelimit.limits_for(self.exchange)
+        self.rate_limiter = ratelimit.RateLimiter(limits) if limits else None
+        # opt-in, see enable_batching
+        self.batchers = None
         self.host = get_trans_host(self.exchange)
         self.host_ws = get_ws_host(self.exchange, self.name)
-        if session is None:
-            self.session = aiohttp.ClientSession(loop=loop)
-        else:
-            self.session = session
+        self._session = session
         self.ws = None
         self.ws_state = IDLE
         self.ws_sub_order = False  # ws is subscribing order or not, true after sub-order is sent
@@ -105,9 +192,31 @@ class Account:
         self.closed = False
 
         self.sub_queue = {}
+        # orders pushed by the websocket once subscribe_orders is active
+        self.orders = OrderStore()
+        # on_update of watched orders, all pushed updates are routed by the single dispatch_orders task
+        self.order_callbacks = {}
+        self.order_callbacks_client = {}
+        # ('client' / 'exchange', oid) -> monotonic time of the last registration or push of a watched order
+        self.order_watch_time = {}
+        self.order_watch_swept = time.monotonic()
+        self.order_updates = asyncio.Queue()
+        self.order_routed = 0
+        self.order_unrouted = 0
+        self.task_dispatch_orders = asyncio.ensure_future(self.dispatch_orders())
         self.tasks_keep_connection = asyncio.Task(self.keep_connection())
         asyncio.ensure_future(self.tasks_keep_connection)
 
+    @property
+    def session(self):
+        """
+        the session given to __init__, otherwise the shared one looked up per request, so a session closed by
+        autil.close_aiohttp_session or bound to another loop is replaced
+        """
+        if self._session is not None:
+            return self._session
+        return autil.get_aiohttp_session()
+
     async def start_subscribe_orders(self):
         log.info('start subscribe orders')
         await self.subscribe_orders()
@@ -117,10 +226,13 @@ class Account:
     def close(self):
         if self.ws and not self.ws.closed:
             asyncio.ensure_future(self.ws.close())
-        if self.session and not self.session.closed:
-            asyncio.ensure_future(self.session.close())
+        # the session is shared with other accounts or owned by the caller
         self.closed = True
         self.tasks_keep_connection.cancel()
+        self.task_dispatch_orders.cancel()
+        self.order_callbacks.clear()
+        self.order_callbacks_client.clear()
+        self.order_watch_time.clear()
 
     def __del__(self):
         self.close()
@@ -131,6 +243,13 @@ class Account:
     def __repr__(self):
         return '<{}:{}>'.format(self.__class__.__name__, self.symbol)
 
+    @property
+    def signer(self):
+        signer = self._signer
+        if signer is None or signer.secret != self.api_secret or signer.api_key != self.api_key:
+            signer = self._signer = Signer(self.api_secret, self.api_key, f'/{self.exchange}/{self.name}')
+        return signer
+
     @property
     def trans_path(self):
         return '{}/{}'.format(self.host, self.name)
@@ -153,6 +272,23 @@ class Account:
         t = await self.api_call('get', '/orders', params=data)
         return t
 
+    def rate_limit_stats(self, unit=1e3):
+        """
+        :return: queueing delay per priority lane, waiting requests per bucket and throttled answers
+        """
+        if self.rate_limiter is None:
+            return {}
+        return self.rate_limiter.stats(unit)
+
+    async def sync_orders(self, contract=None):
+        """
+        seed the order store with the open orders from REST, pushes keep it up to date afterwards
+        """
+        res, err = await self.get_pending_list(contract)
+        if not err and isinstance(res, list):
+            self.orders.load(res)
+        return res, err
+
     async def get_order_list_from_db(self, contract=None, state=None):
         return await self.get_order_list(contract, state, source='db')
 
@@ -164,6 +300,8 @@ class Account:
         :param oids:
         :return:
         """
+        if not oids and self.batchers and ',' not in oid:
+            return await self.batchers['cancel_client_oid'].submit(oid)
         if oids:
             oid = f'{oid},{",".join(oids)}'
         log.debug('Cancel use client oid', oid)
@@ -179,6 +317,8 @@ class Account:
         :param oids:
         :return:
         """
+        if not oids and self.batchers and ',' not in oid:
+            return await self.batchers['cancel_exchange_oid'].submit(oid)
         if oids:
             oid = f'{oid},{",".join(oids)}'
         log.debug('Cancel use exchange oid', oid)
@@ -186,6 +326,33 @@ class Account:
         t = await self.api_call('delete', '/orders', params=data)
         return t
 
+    def enable_batching(self, window=0.005, max_batch=20):
+        """
+        merge single oid cancel_use_*_oid / get_order_use_*_oid calls made within window seconds into one request,
+        each caller gets the part of the response about its oid. Calls with several oids are sent as they are
+
+        :param window: seconds, None to disable
+        :param max_batch: oids per request
+        """
+        if window is None:
+            for batcher in (self.batchers or {}).values():
+                batcher.flush()
+            self.batchers = None
+            return
+
+        def send(method, key):
+            async def call(joined):
+                return await self.api_call(method, '/orders', params={key: joined})
+
+            return call
+
+        self.batchers = {f'{name}_{key}': OidBatcher(send(method, key), key, window, max_batch)
+                         for name, method in [('cancel', 'delete'), ('get', 'get')]
+                         for key in ['client_oid', 'exchange_oid']}
+
+    def batching_stats(self):
+        return {name: batcher.stats() for name, batcher in (self.batchers or {}).items()}
+
     async def cancel_all(self, contract=None):
         log.debug('Cancel all')
         if contract:
@@ -231,6 +398,8 @@ class Account:
         :param oids:
         :return:
         """
+        if not oids and self.batchers and ',' not in oid:
+            return await self.batchers['get_client_oid'].submit(oid)
         if oids:
             oid = f'{oid},{",".join(oids)}'
         res = await self.api_call('get', '/orders', params={'client_oid': oid})
@@ -243,6 +412,8 @@ class Account:
         :param oids:
         :return:
         """
+        if not oids and self.batchers and ',' not in oid:
+            return await self.batchers['get_exchange_oid'].submit(oid)
         if oids:
             oid = f'{oid},{",".join(oids)}'
         res = await self.api_call('get', '/orders', params={'exchange_oid': oid})
@@ -281,7 +452,8 @@ class Account:
         log.debug(res)
         return res
 
-    async def place_order(self, con, price, bs, amount, client_oid=None, tags=None, options=None, on_update=None):
+    async def place_order(self, con, price, bs, amount, client_oid=None, tags=None, options=None, on_update=None,
+                          priority=None):
         """
         just pass request, and handle order update --> fire callback and ref_key
         :param options:
@@ -292,12 +464,32 @@ class Account:
         :param client_oid:
         :param tags: a key value dict
         :param on_update:
+        :param priority: ratelimit.REDUCE for risk reducing orders, ratelimit.ORDER by default
         :return:
         """
-        if on_update and self.ws_state == IDLE:
-            await self.start_subscribe_orders()
+        if on_update:
+            if self.ws_state == IDLE:
+                await self.start_subscribe_orders()
+            if not client_oid:
+                client_oid = util.rand_client_oid(con)
+            # registered before the request so a push arriving ahead of the response is not lost
+            await self.watch_order(on_update, client_oid=client_oid)
         log.debug('place order', con=con, price=price, bs=bs, amount=amount, client_oid=client_oid)
 
+        data = self.order_data(con, price, bs, amount, client_oid, tags, options)
+        try:
+            res = await self.api_call('post', '/orders', data=data, priority=priority)
+        except:
+            if on_update:
+                self.unwatch_order(client_oid)
+            raise
+        log.debug(res)
+        if on_update:
+            self.order_acked(res, client_oid)
+        return res
+
+    @staticmethod
+    def order_data(con, price, bs, amount, client_oid=None, tags=None, options=None):
         data = {'contract': con,
                 'price': price,
                 'bs': bs,
@@ -308,53 +500,173 @@ class Account:
             data['tags'] = tags
         if options:
             data['options'] = options
-        res = await self.api_call('post', '/orders', data=data)
-        log.debug(res)
-        if on_update:
-            if not self.ws_support:
-                log.warning('ws push not supported for this exchange {}'.format(self.exchange))
-            else:
-                if self.ws_state != READY:
-                    log.warning(f'ws connection is {self.ws_state}/{READY}, on_update may failed.')
-                if 'order' not in self.sub_queue:
-                    await self.subscribe_orders()
-                ex, err = res
-                if ex and 'exchange_oid' in ex:
-                    exg_oid = ex['exchange_oid']
-                    if exg_oid not in self.sub_queue['order']:
-                        self.sub_queue['order'][exg_oid] = asyncio.Queue()
-                    asyncio.ensure_future(self.handle_order_q(exg_oid, on_update))
-        return res
+        return data
 
-    async def handle_order_q(self, exg_oid, on_update):
-        if 'order' not in self.sub_queue:
-            log.warning('order was not subscribed, on_update will not be handled.')
-            return
-        q = self.sub_queue['order'].get(exg_oid, None)
-        if not q:
-            log.warning('order queue for {} is not init yet.'.format(exg_oid))
+    @staticmethod
+    def validate_order(con, price, bs, amount):
+        """
+        :return: ValueError or None
+        """
+        if not isinstance(con, str) or '/' not in con:
+            return ValueError(f'invalid contract {con}')
+        if bs not in (Order.BUY, Order.SELL):
+            return ValueError(f'invalid bs {bs}')
+        if isinstance(price, bool) or not isinstance(price, numbers.Real) or not price > 0:
+            return ValueError(f'invalid price {price}')
+        if isinstance(amount, bool) or not isinstance(amount, numbers.Real) or not amount > 0:
+            return ValueError(f'invalid amount {amount}')
+        return None
+
+    async def watch_order(self, on_update, client_oid=None, exchange_oid=None):
+        """
+        call on_update with the ws updates of an order until it ends
+
+        :param on_update:
+        :param client_oid: updates are matched by client oid until the exchange oid is known
+        :param exchange_oid:
+        """
+        assert callable(on_update), 'on_update is not callable'
+        if not self.ws_support:
+            log.warning('ws push not supported for this exchange {}'.format(self.exchange))
             return
-        while self.is_running:
+        if self.ws_state != READY:
+            log.warning(f'ws connection is {self.ws_state}/{READY}, on_update may failed.')
+        if 'order' not in self.sub_queue:
+            await self.subscribe_orders()
+        now = time.monotonic()
+        if now - self.order_watch_swept > self.ORDER_WATCH_TTL / 10:
+            self.expire_watches(now)
+        if client_oid:
+            self.order_callbacks_client[client_oid] = on_update
+        if exchange_oid:
+            self.order_callbacks[exchange_oid] = on_update
+        self.touch_watch(client_oid, exchange_oid, now)
+
+    def unwatch_order(self, client_oid=None, exchange_oid=None):
+        self.order_callbacks_client.pop(client_oid, None)
+        self.order_callbacks.pop(exchange_oid, None)
+        self.order_watch_time.pop(('client', client_oid), None)
+        self.order_watch_time.pop(('exchange', exchange_oid), None)
+
+    def touch_watch(self, client_oid=None, exchange_oid=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        if client_oid and client_oid in self.order_callbacks_client:
+            self.order_watch_time['client', client_oid] = now
+        if exchange_oid and exchange_oid in self.order_callbacks:
+            self.order_watch_time['exchange', exchange_oid] = now
+
+    def expire_watches(self, now=None):
+        """
+        drop the on_update of watched orders without registration or push for ORDER_WATCH_TTL seconds, e.g. the end
+        status was pushed while the websocket was down
+
+        :return: number of dropped callbacks
+        """
+        if now is None:
+            now = time.monotonic()
+        self.order_watch_swept = now
+        deadline = now - self.ORDER_WATCH_TTL
+        expired = [key for key, stamp in self.order_watch_time.items() if stamp <= deadline]
+        for kind, oid in expired:
+            del self.order_watch_time[kind, oid]
+            if kind == 'client':
+                self.order_callbacks_client.pop(oid, None)
+            else:
+                self.order_callbacks.pop(oid, None)
+        return len(expired)
+
+    def order_acked(self, res, client_oid):
+        """
+        link the exchange oid of a placed order to the callback registered by client oid
+        """
+        ex, err = res
+        on_update = self.order_callbacks_client.get(client_oid)
+        if err or not ex:
+            self.unwatch_order(client_oid)
+        elif on_update is not None and ex.get('exchange_oid'):
+            self.order_callbacks[ex['exchange_oid']] = on_update
+            self.touch_watch(client_oid, ex['exchange_oid'])
+
+    async def place_orders(self, orders, limit=16, on_update=None, priority=None):
+        """
+        place many orders concurrently, all of them are validated and serialized before the first request
+
+        :param orders: [{'con': ..., 'price': ..., 'bs': ..., 'amount': ..., 'client_oid', 'tags', 'options'}, ...]
+        :param limit: requests in flight, ignored when BATCH_ORDERS_ENDPOINT is set
+        :param on_update: wired to every placed order like place_order
+        :param priority: ratelimit lane of the requests
+        :return: [(res, err), ...] in the order of orders, invalid or unserializable orders get their error and are
+            not sent
+        """
+        if on_update and self.ws_state == IDLE:
+            await self.start_subscribe_orders()
+        results = [None] * len(orders)
+        pending = []
+        for idx, order in enumerate(orders):
             try:
-                order = await q.get()
-                log.debug('on update order {}'.format(order))
-                if on_update:
-                    assert callable(on_update), 'on_update is not callable'
-
-                    try:
-                        if asyncio.iscoroutinefunction(on_update):
-                            await on_update(order)
-                        else:
-                            on_update(order)
-                    except:
-                        log.exception('handle info error')
-                if order['status'] in Order.END_STATUSES:
-                    log.debug('{} finished with status {}'.format(order['exchange_oid'], order['status']))
-                    break
-            except:
-                log.exception('handle q failed.')
+                order = dict(order)
+                con = order.pop('con', None) or order.pop('contract', None)
+                err = self.validate_order(con, order.get('price'), order.get('bs'), order.get('amount'))
+                if not err and on_update and not order.get('client_oid'):
+                    order['client_oid'] = util.rand_client_oid(con)
+                data = None if err else self.order_data(con, **order)
+            except TypeError as e:
+                err = ValueError(f'invalid order {orders[idx]}: {e}')
+            if not err:
+                try:
+                    body = dump_body(data)
+                except (TypeError, ValueError) as e:
+                    err = HTTPError(HTTPError.HTTP_ERROR, f'invalid request body: {e}')
+            if err:
+                results[idx] = None, err
+            else:
+                pending.append((idx, data, body))
+        log.debug('place orders', len(pending), 'of', len(orders))
 
-        del self.sub_queue['order'][exg_oid]
+        if self.BATCH_ORDERS_ENDPOINT:
+            # a json list of the order bodies, same bytes as dump_body of the list
+            chunks = [pending[i:i + self.BATCH_ORDERS_SIZE] for i in range(0, len(pending), self.BATCH_ORDERS_SIZE)]
+            chunks = [(chunk, b'[' + b', '.join(body for _, _, body in chunk) + b']') for chunk in chunks]
+        if on_update:
+            for _, data, _ in pending:
+                await self.watch_order(on_update, client_oid=data['client_oid'])
+
+        try:
+            if self.BATCH_ORDERS_ENDPOINT:
+                for chunk, body in chunks:
+                    for (idx, _, _), res in zip(chunk, await self._place_batch(body, len(chunk), priority)):
+                        results[idx] = res
+            else:
+                async def place(item):
+                    return await self.api_call('post', '/orders', body=item[2], priority=priority)
+
+                async for (idx, _, _), res, err in autil.bounded(place, pending, limit):
+                    results[idx] = res, err
+        except:
+            if on_update:
+                for _, data, _ in pending:
+                    self.unwatch_order(data['client_oid'])
+            raise
+
+        if on_update:
+            for idx, data, _ in pending:
+                self.order_acked(results[idx], data['client_oid'])
+        return results
+
+    async def _place_batch(self, body, size, priority=None):
+        """
+        :param body: dump_body of the list of order data
+        :param size: number of orders in body
+        :return: [(res, err), ...] of each order
+        """
+        res, err = await self.api_call('post', self.BATCH_ORDERS_ENDPOINT, body=body, priority=priority)
+        if err:
+            return [(None, err)] * size
+        if not isinstance(res, list) or len(res) != size:
+            err = ValueError(f'unexpected batch response {res}')
+            return [(None, err)] * size
+        return [(None, x['error']) if isinstance(x, dict) and x.get('error') else (x, None) for x in res]
 
     async def get_dealt_trans(self, con=None, source=None):
         """
@@ -467,8 +779,21 @@ class Account:
     def is_running(self):
         return not self.closed
 
-    async def api_call(self, method, endpoint, params=None, data=None, timeout=15):
+    async def api_call(self, method, endpoint, params=None, data=None, timeout=15, body=None, priority=None):
+        """
+        :param body: data already serialized to bytes by dump_body
+        :param priority: ratelimit lane, by default from the endpoint family
+        """
+        if body is None:
+            try:
+                body = dump_body(data) if data else b''
+            except (TypeError, ValueError) as e:
+                return None, HTTPError(HTTPError.HTTP_ERROR, f'invalid request body: {e}')
         method = method.upper()
+        limiter = self.rate_limiter
+        if limiter is not None:
+            family = ratelimit.endpoint_family(method, endpoint)
+            await limiter.acquire(family, priority)
         if method == 'GET':
             func = self.session.get
         elif method == 'POST':
@@ -480,18 +805,12 @@ class Account:
         else:
             raise Exception('Invalid http method:{}'.format(method))
 
-        nonce = gen_nonce()
-        # headers = {'jwt': gen_jwt(self.secret, self.user_name)}
-
         url = self.trans_path + endpoint
-
-        # print(self.api_secret, method, url, nonce, data)
-        json_str = json.dumps(data) if data else ''
-        sign = gen_sign(self.api_secret, method, '/{}/{}{}'.format(self.exchange, self.name, endpoint), nonce, json_str)
-        headers = {'Api-Nonce': str(nonce), 'Api-Key': self.api_key, 'Api-Signature': sign,
-                   'Content-Type': 'application/json'}
-        res, err = await autil.http_go(func, url=url, data=json_str, params=params, headers=headers, timeout=timeout)
+        headers = self.signer.headers(method, endpoint, body)
+        res, err = await autil.http_go(func, url=url, data=body, params=params, headers=headers, timeout=timeout)
         if err:
+            if limiter is not None and Code.ACCOUNT_TOO_FREQUENT in str(err):
+                limiter.penalize(family, self.TOO_FREQUENT_BACKOFF)
             return None, err
         return res, None
 
@@ -558,7 +877,7 @@ class Account:
 
     async def handle_message(self, msg):
         try:
-            data = json.loads(msg)
+            data = codec.loads(msg)
             log.debug(data)
             if 'uri' not in data:
                 if 'code' in data:
@@ -598,17 +917,11 @@ class Account:
             elif action == 'order' and 'order' in self.sub_queue:
                 if data.get('status', 'ok') == 'ok':
                     for order in data['data']:
-                        exg_oid = order['exchange_oid']
-                        log.debug('order info updating', exg_oid, status=order['status'])
-                        if exg_oid not in self.sub_queue['order']:
-                            q = asyncio.Queue()
-                            self.sub_queue['order'][exg_oid] = q
-                            asyncio.ensure_future(self.ensure_order_dequeued(exg_oid))
-                        self.sub_queue['order'][exg_oid].put_nowait(order)
-                        if '*' in self.sub_queue['order']:
-                            h = self.sub_queue['order']['*']
-                            if asyncio.iscoroutinefunction(h):
-                                await h(order)
+                        if not self.orders.apply(order):
+                            log.debug('stale order update discarded', order['exchange_oid'], order.get('version'))
+                            continue
+                        log.debug('order info updating', order['exchange_oid'], status=order['status'])
+                        self.order_updates.put_nowait(order)
                 else:
                     # todo 这里处理order 拿到 error 的情况
                     log.warning('order update error message', data)
@@ -617,15 +930,45 @@ class Account:
         except Exception as e:
             log.exception('handle msg exception', msg)
 
-    async def ensure_order_dequeued(self, exg_oid):
-        timeout = 10
-        bg = datetime.now()
-        while 'order' in self.sub_queue and exg_oid in self.sub_queue['order'] \
-            and not self.sub_queue['order'][exg_oid].empty():
-            if (datetime.now() - bg).total_seconds() > timeout:
-                del self.sub_queue['order'][exg_oid]
+    async def dispatch_orders(self):
+        while self.is_running:
+            try:
+                order = await self.order_updates.get()
+            except asyncio.CancelledError:
                 break
-            await asyncio.sleep(2)
+            await self.route_order(order)
+
+    async def route_order(self, order):
+        """
+        call the on_update watching the order and the subscribe_orders handler, in push order
+        """
+        exg_oid = order.get('exchange_oid')
+        client_oid = order.get('client_oid')
+        on_update = self.order_callbacks.get(exg_oid)
+        if on_update is None and client_oid:
+            on_update = self.order_callbacks_client.get(client_oid)
+            if on_update is not None and exg_oid:
+                self.order_callbacks[exg_oid] = on_update
+        if on_update is not None:
+            self.touch_watch(client_oid, exg_oid)
+        handler = self.sub_queue.get('order', {}).get('*')
+        if on_update is None and handler is None:
+            self.order_unrouted += 1
+        else:
+            self.order_routed += 1
+        for callback in (on_update, handler):
+            if callback is None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(callback):
+                    await callback(order)
+                else:
+                    callback(order)
+            except:
+                log.exception('handle order update error')
+        if order.get('status') in Order.END_STATUSES:
+            log.debug('{} finished with status {}'.format(exg_oid, order['status']))
+            self.unwatch_order(client_oid, exg_oid)
 
     async def subscribe_info(self, handler, handler_name=None):
         if not self.ws_support:
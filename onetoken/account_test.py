@@ -0,0 +1,217 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from . import account, autil
+from .config import Config
+from .model import Order
+from .rpcutil import HTTPError
+
+SECRET = 'this-is-long-secret'
+
+
+async def start_trade_server(monkeypatch):
+    state = {'running': 0, 'peak': 0, 'bodies': []}
+
+    async def post_orders(request):
+        body = await request.read()
+        sign = account.gen_sign(SECRET, 'POST', request.path, request.headers['Api-Nonce'], body.decode())
+        if sign != request.headers['Api-Signature']:
+            return web.json_response({'code': 'invalid-signature'}, status=401)
+        state['bodies'].append(body)
+        state['running'] += 1
+        state['peak'] = max(state['peak'], state['running'])
+        data = await request.json()
+        await asyncio.sleep(0.01 if data['price'] % 2 else 0.03)
+        state['running'] -= 1
+        return web.json_response({'exchange_oid': f'okex/btc.usdt-{data["price"]}', 'client_oid': 'c'})
+
+    app = web.Application()
+    app.router.add_post('/okex/demo/orders', post_orders)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    monkeypatch.setattr(Config, 'TRADE_HOST', f'http://127.0.0.1:{runner.addresses[0][1]}')
+    return runner, state
+
+
+@pytest.mark.asyncio
+async def test_place_orders(monkeypatch):
+    runner, trade_server = await start_trade_server(monkeypatch)
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    orders = [{'con': 'okex/btc.usdt', 'price': 1 + i, 'bs': 'b', 'amount': 1} for i in range(10)]
+    orders.insert(3, {'con': 'okex/btc.usdt', 'price': 1, 'bs': 'x', 'amount': 1})
+    try:
+        results = await acc.place_orders(orders, limit=3)
+    finally:
+        acc.close()
+        await autil.close_aiohttp_session()
+        await runner.cleanup()
+    assert len(results) == 11
+    assert isinstance(results[3][1], ValueError)
+    prices = [o['price'] for i, o in enumerate(orders) if i != 3]
+    assert [res['exchange_oid'] for res, err in results if not err] == [f'okex/btc.usdt-{p}' for p in prices]
+    assert trade_server['peak'] == 3
+    assert len(trade_server['bodies']) == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('batch', [False, True])
+async def test_place_orders_serialized_per_order(monkeypatch, batch):
+    np = pytest.importorskip('numpy')
+    runner, trade_server = await start_trade_server(monkeypatch)
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    if batch:
+        batches = []
+
+        async def send_batch(method, endpoint, body=None, priority=None, **kwargs):
+            batches.append(json.loads(body))
+            return [{'exchange_oid': f'okex/btc.usdt-{x["price"]}'} for x in batches[-1]], None
+
+        monkeypatch.setattr(acc, 'BATCH_ORDERS_ENDPOINT', '/orders/batch', raising=False)
+        monkeypatch.setattr(acc, 'BATCH_ORDERS_SIZE', 2, raising=False)
+        monkeypatch.setattr(acc, 'api_call', send_batch)
+    orders = [{'con': 'okex/btc.usdt', 'price': np.int64(1 + i), 'bs': 'b', 'amount': 1} for i in range(4)]
+    orders[1]['tags'] = {'strategy': object()}
+    try:
+        results = await acc.place_orders(orders, limit=2)
+    finally:
+        acc.close()
+        await autil.close_aiohttp_session()
+        await runner.cleanup()
+    assert isinstance(results[1][1], HTTPError) and results[1][1].code == HTTPError.HTTP_ERROR
+    assert [res['exchange_oid'] for res, err in results if not err] == ['okex/btc.usdt-1', 'okex/btc.usdt-3',
+                                                                       'okex/btc.usdt-4']
+    if batch:
+        assert [[x['price'] for x in chunk] for chunk in batches] == [[1, 3], [4]]
+    else:
+        assert len(trade_server['bodies']) == 3
+
+
+@pytest.mark.asyncio
+async def test_place_order_numpy_price(monkeypatch):
+    np = pytest.importorskip('numpy')
+    runner, trade_server = await start_trade_server(monkeypatch)
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    try:
+        res, err = await acc.place_order('okex/btc.usdt', np.float64(3.0), 'b', np.int64(2))
+        nan_res, nan_err = await acc.place_order('okex/btc.usdt', np.float64('nan'), 'b', 1)
+        obj_res, obj_err = await acc.place_order('okex/btc.usdt', 3, 'b', object())
+    finally:
+        acc.close()
+        await autil.close_aiohttp_session()
+        await runner.cleanup()
+    assert err is None and res['exchange_oid'] == 'okex/btc.usdt-3.0'
+    assert json.loads(trade_server['bodies'][0]) == {'contract': 'okex/btc.usdt', 'price': 3.0, 'bs': 'b', 'amount': 2}
+    assert nan_res is None and nan_err.code == HTTPError.HTTP_ERROR
+    assert obj_res is None and obj_err.code == HTTPError.HTTP_ERROR
+    assert len(trade_server['bodies']) == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_session_looked_up_per_request():
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    first = acc.session
+    assert first is autil.get_aiohttp_session()
+    await autil.close_aiohttp_session()
+    assert acc.session is not first and not acc.session.closed
+    acc.close()
+    await autil.close_aiohttp_session()
+
+
+@pytest.mark.asyncio
+async def test_order_updates_routed_by_one_dispatcher():
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    acc.sub_queue['order'] = {}
+    got = []
+    await acc.watch_order(got.append, client_oid='c1')
+
+    def push(*orders):
+        return json.dumps({'uri': 'order', 'data': [dict(o, contract='okex/btc.usdt', version=i)
+                                                    for i, o in enumerate(orders)]})
+
+    # the push arrives before the REST response of the order
+    await acc.handle_message(push({'exchange_oid': 'e1', 'client_oid': 'c1', 'status': Order.PENDING}))
+    acc.order_acked(({'exchange_oid': 'e1', 'client_oid': 'c1'}, None), 'c1')
+    await acc.handle_message(push({'exchange_oid': 'e2', 'client_oid': 'c2', 'status': Order.PENDING}))
+    await acc.handle_message(push({'exchange_oid': 'e1', 'client_oid': 'c1', 'status': Order.PART_DEAL_PENDING},
+                                  {'exchange_oid': 'e1', 'client_oid': 'c1', 'status': Order.PART_DEAL_PENDING}))
+    # a version older than the stored order is not routed
+    await acc.handle_message(push({'exchange_oid': 'e1', 'client_oid': 'c1', 'status': Order.PENDING}))
+    await acc.handle_message(json.dumps({'uri': 'order', 'data': [
+        {'exchange_oid': 'e1', 'client_oid': 'c1', 'status': Order.DEALT, 'contract': 'okex/btc.usdt', 'version': 2}]}))
+    await asyncio.sleep(0.01)
+    assert [o['status'] for o in got] == [Order.PENDING, Order.PART_DEAL_PENDING, Order.PART_DEAL_PENDING,
+                                          Order.DEALT]
+    assert acc.order_routed == 4 and acc.order_unrouted == 1 and acc.orders.stale == 1
+    assert not acc.order_callbacks and not acc.order_callbacks_client and not acc.order_watch_time
+    assert acc.orders.get('e2')['status'] == Order.PENDING
+    acc.close()
+    await autil.close_aiohttp_session()
+
+
+@pytest.mark.asyncio
+async def test_order_callbacks_cleaned_up(monkeypatch):
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    acc.sub_queue['order'] = {}
+    acc.ws_state = account.READY
+
+    async def rejected(*args, **kwargs):
+        return None, 'order-rejected'
+
+    monkeypatch.setattr(acc, 'api_call', rejected)
+    res = await acc.place_order('okex/btc.usdt', 1, 'b', 1, client_oid='c1', on_update=print)
+    assert res == (None, 'order-rejected')
+    results = await acc.place_orders([{'con': 'okex/btc.usdt', 'price': 1, 'bs': 'b', 'amount': 1}], on_update=print)
+    assert results == [(None, 'order-rejected')]
+    assert not acc.order_callbacks_client and not acc.order_watch_time
+
+    await acc.watch_order(print, client_oid='c2')
+    await acc.watch_order(print, exchange_oid='e3')
+    acc.order_watch_time['client', 'c2'] -= acc.ORDER_WATCH_TTL
+    assert acc.expire_watches() == 1
+    assert list(acc.order_callbacks_client) == [] and list(acc.order_callbacks) == ['e3']
+    acc.close()
+    assert not acc.order_callbacks and not acc.order_watch_time
+    await autil.close_aiohttp_session()
+
+
+@pytest.mark.asyncio
+async def test_batch_cancels_and_lookups(monkeypatch):
+    requests = []
+
+    async def orders(request):
+        key = 'client_oid' if 'client_oid' in request.query else 'exchange_oid'
+        oids = request.query[key].split(',')
+        requests.append((request.method, oids))
+        return web.json_response([{key: oid, 'status': 'withdrawing' if request.method == 'DELETE' else 'pending'}
+                                  for oid in oids if oid != 'missing'])
+
+    app = web.Application()
+    app.router.add_route('*', '/okex/demo/orders', orders)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    monkeypatch.setattr(Config, 'TRADE_HOST', f'http://127.0.0.1:{runner.addresses[0][1]}')
+    acc = account.Account('okex/demo', api_key='key', api_secret=SECRET)
+    acc.enable_batching(window=0.01, max_batch=4)
+    try:
+        cancels = await asyncio.gather(*[acc.cancel_use_client_oid(f'c{i}') for i in range(6)])
+        lookups = await asyncio.gather(acc.get_order_use_exchange_oid('e1'), acc.get_order_use_exchange_oid('missing'))
+        joined = await acc.cancel_use_exchange_oid('e7,e8')
+        acc.enable_batching(None)
+        single = await acc.get_order_use_client_oid('c9')
+    finally:
+        acc.close()
+        await autil.close_aiohttp_session()
+        await runner.cleanup()
+    assert requests == [('DELETE', ['c0', 'c1', 'c2', 'c3']), ('DELETE', ['c4', 'c5']), ('GET', ['e1', 'missing']),
+                        ('DELETE', ['e7', 'e8']), ('GET', ['c9'])]
+    assert len(joined[0]) == 2
+    assert cancels[5] == ([{'client_oid': 'c5', 'status': 'withdrawing'}], None)
+    assert lookups == [([{'exchange_oid': 'e1', 'status': 'pending'}], None), ([], None)]
+    assert single == ([{'client_oid': 'c9', 'status': 'pending'}], None)
@@ -0,0 +1,171 @@
+"""
+build candles of many durations locally from zhubi (trade) streams
+
+    builder = CandleBuilder(['1s', '5s', '1m', '5m'], on_close=on_bar)
+    await quote.subscribe_zhubi('okef/btc.usd.q', builder.on_zhubi)
+
+bars are aligned to the epoch (UTC), a trade updates every duration in O(1). The bar passed to on_update is the
+live in-progress candle and keeps changing, the bar passed to on_close is final: a trade arriving after its bar was
+closed is dropped and counted in late.
+"""
+import asyncio
+import time
+
+import arrow
+
+from .logger import log
+from .model import Candle
+from .timeparse import parse_epoch
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def duration_seconds(duration):
+    """
+    '1s' -> 1, '5m' -> 300, '1h' -> 3600
+    """
+    return int(duration[:-1]) * UNITS[duration[-1]]
+
+
+class _Bar:
+    __slots__ = ['start', 'end', 'candle']
+
+    def __init__(self, start, end, candle):
+        self.start = start
+        self.end = end
+        self.candle = candle
+
+
+class CandleBuilder:
+    def __init__(self, durations, on_close=None, on_update=None, raw_time=False, grace=1.0):
+        """
+
+        :param durations: ['1s', '5s', '1m', ...]
+        :param on_close: called with each finished Candle
+        :param on_update: called with the in-progress Candle of each duration after every zhubi batch
+        :param raw_time: candle time as epoch float instead of arrow, same as CandleQuote
+        :param grace: seconds close_expired waits after the end of a bar for trades still in flight, also covers a
+            local clock ahead of the exchange
+        """
+        self.durations = [(d, duration_seconds(d)) for d in durations]
+        self.on_close = on_close
+        self.on_update = on_update
+        self.raw_time = raw_time
+        self.grace = grace
+        self.bars = {}
+        # (contract, duration) -> end of the last closed bar
+        self.closed_end = {}
+        self.late = 0
+        self.timer = None
+
+    def _new_bar(self, contract, duration, seconds, t, price):
+        start = t - t % seconds
+        tm = float(start) if self.raw_time else arrow.Arrow.utcfromtimestamp(start)
+        candle = Candle(tm, price, price, price, price, 0, contract, duration, 0)
+        return _Bar(start, start + seconds, candle)
+
+    def update(self, zhubi):
+        """
+        apply one trade
+
+        :return: list of candles closed by this trade
+        """
+        t = parse_epoch(zhubi.exchange_time if zhubi.exchange_time is not None else zhubi.time)
+        price = zhubi.price
+        amount = zhubi.amount
+        closed = []
+        for duration, seconds in self.durations:
+            key = zhubi.contract, duration
+            if t < self.closed_end.get(key, t):
+                # the bar of this trade was already passed to on_close
+                self.late += 1
+                continue
+            bar = self.bars.get(key)
+            if bar is None or t >= bar.end:
+                if bar is not None:
+                    closed.append(bar.candle)
+                    self.closed_end[key] = bar.end
+                bar = self._new_bar(zhubi.contract, duration, seconds, t, price)
+                self.bars[key] = bar
+            elif t < bar.start:
+                # trade before the first bar of the contract, folded into it
+                self.late += 1
+            c = bar.candle
+            if price > c.high:
+                c.high = price
+            if price < c.low:
+                c.low = price
+            c.close = price
+            c.volume += amount
+            c.amount += price * amount
+        return closed
+
+    def close_expired(self, now=None):
+        """
+        close bars whose period ended more than grace seconds ago even if no trade arrived after it
+
+        :return: list of closed candles
+        """
+        if now is None:
+            now = time.time()
+        closed = []
+        for key, bar in list(self.bars.items()):
+            if now >= bar.end + self.grace:
+                closed.append(bar.candle)
+                self.closed_end[key] = bar.end
+                del self.bars[key]
+        return closed
+
+    def current(self, contract, duration):
+        """
+        :return: in-progress candle or None
+        """
+        bar = self.bars.get((contract, duration))
+        return bar.candle if bar else None
+
+    async def on_zhubi(self, zhubis):
+        """
+        on_update handler for subscribe_zhubi
+        """
+        closed = []
+        for zhubi in zhubis:
+            closed.extend(self.update(zhubi))
+        await self._emit(closed, zhubis[0].contract if zhubis else None)
+
+    async def _emit(self, closed, contract=None):
+        for candle in closed:
+            await self._call(self.on_close, candle)
+        if self.on_update and contract is not None:
+            for duration, _ in self.durations:
+                bar = self.bars.get((contract, duration))
+                if bar:
+                    await self._call(self.on_update, bar.candle)
+
+    @staticmethod
+    async def _call(callback, candle):
+        if callback is None:
+            return
+        try:
+            if asyncio.iscoroutinefunction(callback):
+                await callback(candle)
+            else:
+                callback(candle)
+        except:
+            log.exception('candle callback fail')
+
+    def start_timer(self, interval=0.5):
+        """
+        close bars by wall clock, so quiet contracts still get their bars
+        """
+        if self.timer is None:
+            self.timer = asyncio.ensure_future(self._timer_loop(interval))
+
+    async def _timer_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self._emit(self.close_expired())
+
+    def stop_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,51 @@
+import pytest
+
+from .aggregate import CandleBuilder, duration_seconds
+from .model import Zhubi
+
+
+def zhubi(t, price, amount):
+    return Zhubi(t, t, 'okef/btc.usd.q', price, amount, 'b')
+
+
+def test_duration_seconds():
+    assert duration_seconds('1s') == 1
+    assert duration_seconds('5m') == 300
+    assert duration_seconds('4h') == 14400
+
+
+@pytest.mark.asyncio
+async def test_build_multi_duration():
+    closed = []
+    live = []
+    builder = CandleBuilder(['1s', '5s'], on_close=closed.append, on_update=live.append, raw_time=True)
+    await builder.on_zhubi([zhubi(100.1, 10, 1), zhubi(100.5, 12, 2), zhubi(100.9, 9, 1)])
+    assert not closed
+    assert [c.duration for c in live] == ['1s', '5s']
+    c = builder.current('okef/btc.usd.q', '1s')
+    assert (c.time, c.open, c.high, c.low, c.close, c.volume, c.amount) == (100.0, 10, 12, 9, 9, 4, 43)
+
+    await builder.on_zhubi([zhubi(101.2, 11, 1), zhubi(105.0, 8, 1)])
+    assert [(c.duration, c.time) for c in closed] == [('1s', 100.0), ('1s', 101.0), ('5s', 100.0)]
+    assert closed[1].volume == 1
+    five = closed[2]
+    assert (five.open, five.high, five.low, five.close, five.volume, five.amount) == (10, 12, 9, 11, 5, 54)
+
+    assert builder.close_expired(now=106.9) == []
+    assert [c.time for c in builder.close_expired(now=107)] == [105.0]
+    assert builder.current('okef/btc.usd.q', '1s') is None
+    assert builder.current('okef/btc.usd.q', '5s').time == 105.0
+
+
+def test_late_trade_after_timer_close_dropped():
+    builder = CandleBuilder(['1s'], raw_time=True, grace=0.1)
+    builder.update(zhubi(100.2, 10, 1))
+    # in flight trades of the grace period still count
+    assert builder.close_expired(now=101.05) == []
+    builder.update(zhubi(100.8, 9, 1))
+    assert [(c.time, c.volume) for c in builder.close_expired(now=101.1)] == [(100.0, 2)]
+    assert builder.update(zhubi(100.9, 11, 1)) == []
+    assert builder.current('okef/btc.usd.q', '1s') is None
+    assert builder.late == 1
+    builder.update(zhubi(101.5, 12, 1))
+    assert [c.time for c in builder.close_expired(now=102.1)] == [101.0]
@@ -17,16 +17,203 @@ def dumper(obj):
     return obj
 
 
+class DropOldestQueue(asyncio.Queue):
+    """
+    bounded queue that never blocks the producer, the oldest item is discarded when full
+    """
+
+    def __init__(self, maxsize):
+        assert maxsize > 0
+        super().__init__(maxsize)
+        self.discarded = 0
+
+    def put_nowait(self, item):
+        if self.full():
+            self.get_nowait()
+            # the discarded item is never processed, keep join() from waiting for it
+            self.task_done()
+            self.discarded += 1
+        super().put_nowait(item)
+
+
+class LatestQueue(DropOldestQueue):
+    """
+    keep only the newest item, unread items are conflated into it
+    """
+
+    def __init__(self):
+        super().__init__(1)
+
+
+async def bounded(func, items, limit=16):
+    """
+    call func(item) for every item with at most limit calls in flight
+
+    :param func: async, item -> (res, err)
+    :param items: iterable, consumed lazily
+    :param limit:
+    :return: async iterator of (item, res, err) in completion order, an exception raised by func is returned as err
+    """
+    items = iter(items)
+    done = asyncio.Queue()
+    finished = object()
+
+    async def worker():
+        try:
+            for item in items:
+                try:
+                    res, err = await func(item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    res, err = None, e
+                done.put_nowait((item, res, err))
+        finally:
+            done.put_nowait(finished)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, limit))]
+    running = len(workers)
+    try:
+        while running:
+            result = await done.get()
+            if result is finished:
+                running -= 1
+            else:
+                yield result
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+async def gather_bounded(func, items, limit=16):
+    """
+    :return: {item: (res, err)}
+    """
+    return {item: (res, err) async for item, res, err in bounded(func, items, limit)}
+
+
+# connector settings of sessions made by new_session
+CONNECTION_LIMIT = 256
+CONNECTION_LIMIT_PER_HOST = 64
+KEEPALIVE_TIMEOUT = 60
+DNS_TTL = 300
+
+
+class PoolStats:
+    """
+    connection pool usage of the sessions made by new_session, collected with an aiohttp TraceConfig
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.queued = 0
+        self.queued_seconds = 0.0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace.on_connection_queued_start.append(self._on_queued_start)
+        trace.on_connection_queued_end.append(self._on_queued_end)
+        trace.on_dns_cache_hit.append(self._on_dns_hit)
+        trace.on_dns_cache_miss.append(self._on_dns_miss)
+        return trace
+
+    async def _on_request_start(self, session, ctx, params):
+        self.requests += 1
+        self.in_flight += 1
+
+    async def _on_request_end(self, session, ctx, params):
+        self.in_flight -= 1
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.in_flight -= 1
+        self.errors += 1
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.connections_reused += 1
+
+    async def _on_queued_start(self, session, ctx, params):
+        self.queued += 1
+        ctx.queued_at = asyncio.get_event_loop().time()
+
+    async def _on_queued_end(self, session, ctx, params):
+        self.queued_seconds += asyncio.get_event_loop().time() - ctx.queued_at
+
+    async def _on_dns_hit(self, session, ctx, params):
+        self.dns_hits += 1
+
+    async def _on_dns_miss(self, session, ctx, params):
+        self.dns_misses += 1
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+pool_stats = PoolStats()
+
+
+def new_session(limit=CONNECTION_LIMIT, limit_per_host=CONNECTION_LIMIT_PER_HOST, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_TTL, stats=pool_stats):
+    """
+    ClientSession on a tuned TCPConnector: bounded pool per host, kept alive connections and cached dns
+
+    :param stats: PoolStats updated by the session, None for no tracing
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host,
+                                     keepalive_timeout=keepalive_timeout, ttl_dns_cache=ttl_dns_cache)
+    trace_configs = [stats.trace_config()] if stats is not None else None
+    return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+
+
 _aiohttp_sess = None
+_aiohttp_loop = None
 
 
 def get_aiohttp_session():
-    global _aiohttp_sess
-    if _aiohttp_sess is None:
-        _aiohttp_sess = aiohttp.ClientSession()
+    """
+    session shared by the quote REST helpers and every Account not given its own, created on first use and again
+    if it was closed or belongs to another event loop
+    """
+    global _aiohttp_sess, _aiohttp_loop
+    loop = asyncio.get_event_loop()
+    if _aiohttp_sess is None or _aiohttp_sess.closed or _aiohttp_loop is not loop:
+        _aiohttp_sess = new_session()
+        _aiohttp_loop = loop
     return _aiohttp_sess
 
 
+async def close_aiohttp_session():
+    global _aiohttp_sess
+    if _aiohttp_sess is not None and not _aiohttp_sess.closed:
+        await _aiohttp_sess.close()
+    _aiohttp_sess = None
+
+
+def get_pool_stats():
+    """
+    :return: usage counters of the shared pool and the connector limits
+    """
+    stats = pool_stats.to_dict()
+    stats.update({'limit': CONNECTION_LIMIT, 'limit_per_host': CONNECTION_LIMIT_PER_HOST})
+    if _aiohttp_sess is not None and not _aiohttp_sess.closed:
+        stats['limit'] = _aiohttp_sess.connector.limit
+        stats['limit_per_host'] = _aiohttp_sess.connector.limit_per_host
+    return stats
+
+
 async def http_go(func, url, timeout=15, method='json', accept_4xx=False, *args, **kwargs):
     """
 
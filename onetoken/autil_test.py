@@ -1,3 +1,5 @@
+import asyncio
+
 import aiohttp
 import pytest
 
@@ -16,3 +18,80 @@ async def test_http():
         res, err = await autil.http_go(sess.get, url='http://localhost:3000/stream-html', timeout=5)
         print(res)
         print(err)
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_queue():
+    from . import autil
+    q = autil.DropOldestQueue(2)
+    for i in range(5):
+        q.put_nowait(i)
+    assert q.discarded == 3
+    assert [await q.get(), await q.get()] == [3, 4]
+
+    q = autil.LatestQueue()
+    for i in range(5):
+        q.put_nowait(i)
+    assert q.discarded == 4
+    assert await q.get() == 4
+    assert q.empty()
+    q.task_done()
+    await asyncio.wait_for(q.join(), 1)
+
+
+@pytest.mark.asyncio
+async def test_bounded():
+    import asyncio
+    from . import autil
+    running = 0
+    peak = 0
+
+    async def fetch(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (i % 5))
+        running -= 1
+        if i == 7:
+            raise ValueError('boom')
+        return i * 2, None
+
+    order = [item async for item, res, err in autil.bounded(fetch, range(50), limit=4)]
+    assert sorted(order) == list(range(50))
+    assert peak == 4
+    results = await autil.gather_bounded(fetch, range(10), limit=3)
+    assert results[3] == (6, None)
+    assert isinstance(results[7][1], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_shared_session_pool_stats():
+    from aiohttp import web
+    from . import autil
+
+    async def hello(request):
+        return web.json_response({'ok': True})
+
+    app = web.Application()
+    app.router.add_get('/', hello)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        sess = autil.get_aiohttp_session()
+        assert autil.get_aiohttp_session() is sess
+        before = autil.get_pool_stats()
+        for _ in range(3):
+            res, err = await autil.http_go(sess.get, f'http://127.0.0.1:{port}/')
+            assert res == {'ok': True}
+        stats = autil.get_pool_stats()
+        assert stats['requests'] - before['requests'] == 3
+        assert stats['connections_created'] - before['connections_created'] == 1
+        assert stats['connections_reused'] - before['connections_reused'] == 2
+        assert stats['in_flight'] == 0
+        assert stats['limit_per_host'] == autil.CONNECTION_LIMIT_PER_HOST
+    finally:
+        await autil.close_aiohttp_session()
+        await runner.cleanup()
@@ -0,0 +1,96 @@
+"""
+merge single oid calls into one comma joined request
+
+cancel and lookup endpoints accept client_oid / exchange_oid as a comma joined list. An OidBatcher collects the oids
+submitted by independent coroutines for up to window seconds (or max_batch oids), sends one request, and gives each
+caller the part of the response about its oid: the items of a list response whose key field is the oid, or a dict
+response if it is about the oid (a not found error otherwise). A batch of one oid gets the response unchanged. If the
+batch request fails, or its response does not name the oid of every item, each oid is requested on its own.
+"""
+import asyncio
+
+from .logger import log
+from .rpcutil import Const, ServiceError
+
+
+class OidBatcher:
+    def __init__(self, send, key, window=0.005, max_batch=20):
+        """
+
+        :param send: async, comma joined oids -> (res, err)
+        :param key: field naming the oid in response items, client_oid or exchange_oid
+        :param window: seconds the first oid of a batch waits for others
+        :param max_batch: oids sent at once
+        """
+        self.send = send
+        self.key = key
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.timer = None
+        self.calls = 0
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def submit(self, oid):
+        """
+        :return: (res, err) about oid
+        """
+        fut = asyncio.get_event_loop().create_future()
+        self.pending.append((oid, fut))
+        self.calls += 1
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.window, self.flush)
+        return await fut
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.batches += 1
+        asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch):
+        oids = list(dict.fromkeys(oid for oid, _ in batch))
+        res, err = await self._call(','.join(oids))
+        if len(oids) > 1 and (err or not self.splittable(res)):
+            # one bad oid may fail the whole request, and items without oid cannot be told apart
+            self.fallbacks += 1
+            by_oid = dict(zip(oids, await asyncio.gather(*[self._call(oid) for oid in oids])))
+        else:
+            by_oid = {oid: (None, err) if err else self.split(res, oid, len(oids)) for oid in oids}
+        for oid, fut in batch:
+            if not fut.done():
+                fut.set_result(by_oid[oid])
+
+    async def _call(self, oids):
+        try:
+            return await self.send(oids)
+        except Exception as e:
+            log.exception('batch request failed', self.key, oids)
+            return None, e
+
+    def splittable(self, res):
+        if isinstance(res, list):
+            return all(isinstance(x, dict) and self.key in x for x in res)
+        return isinstance(res, dict) and self.key in res
+
+    def split(self, res, oid, size):
+        """
+        :return: (res, err) about oid
+        """
+        if size == 1:
+            return res, None
+        if isinstance(res, list):
+            return [x for x in res if x[self.key] == oid], None
+        if res[self.key] == oid:
+            return res, None
+        return None, ServiceError(Const.LOGIC_ERROR, f'{self.key} {oid} not in batch response')
+
+    def stats(self):
+        return {'calls': self.calls, 'batches': self.batches, 'fallbacks': self.fallbacks, 'pending': len(self.pending)}
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from .batcher import OidBatcher
+from .rpcutil import ServiceError
+
+
+@pytest.mark.asyncio
+async def test_response_without_oid_field_requested_per_oid():
+    sent = []
+
+    async def send(oids):
+        sent.append(oids)
+        return [{'status': f'withdrawing {oid}'} for oid in oids.split(',')], None
+
+    batcher = OidBatcher(send, 'client_oid', window=0.01)
+    results = await asyncio.gather(batcher.submit('c1'), batcher.submit('c2'))
+    assert sent == ['c1,c2', 'c1', 'c2']
+    assert results == [([{'status': 'withdrawing c1'}], None), ([{'status': 'withdrawing c2'}], None)]
+    assert batcher.stats()['fallbacks'] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_error_requested_per_oid():
+    sent = []
+
+    async def send(oids):
+        sent.append(oids)
+        if 'bad' in oids.split(','):
+            return None, 'client-oid-not-exist'
+        return {'client_oid': oids, 'status': 'withdrawing'}, None
+
+    batcher = OidBatcher(send, 'client_oid', window=0.01)
+    results = await asyncio.gather(batcher.submit('c1'), batcher.submit('bad'))
+    assert sent == ['c1,bad', 'c1', 'bad']
+    assert results == [({'client_oid': 'c1', 'status': 'withdrawing'}, None), (None, 'client-oid-not-exist')]
+
+
+def test_split():
+    batcher = OidBatcher(None, 'client_oid')
+    assert batcher.split({'client_oid': 'other'}, 'c1', 1) == ({'client_oid': 'other'}, None)
+    assert batcher.split([{'client_oid': 'c2'}], 'c1', 2) == ([], None)
+    res, err = batcher.split({'client_oid': 'c2'}, 'c1', 2)
+    assert res is None and isinstance(err, ServiceError)
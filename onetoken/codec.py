@@ -0,0 +1,73 @@
+"""
+json / gzip codec for websocket frames
+
+orjson or ujson is used when installed, otherwise the stdlib json
+"""
+import json
+import zlib
+
+# zlib wbits accepting a gzip header
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def _json_backend():
+    return 'json', json.loads, json.dumps
+
+
+def _ujson_backend():
+    import ujson
+    return 'ujson', ujson.loads, ujson.dumps
+
+
+def _orjson_backend():
+    import orjson
+    orjson_dumps = orjson.dumps
+
+    def dumps(obj):
+        return orjson_dumps(obj).decode()
+
+    return 'orjson', orjson.loads, dumps
+
+
+BACKENDS = {'orjson': _orjson_backend, 'ujson': _ujson_backend, 'json': _json_backend}
+
+BACKEND = None
+loads = None
+dumps = None
+
+
+def set_backend(name=None):
+    """
+    :param name: orjson, ujson or json, None picks the fastest installed one
+    :return: name of the backend in use
+    """
+    global BACKEND, loads, dumps
+    names = [name] if name else ['orjson', 'ujson', 'json']
+    for item in names:
+        try:
+            BACKEND, loads, dumps = BACKENDS[item]()
+            return BACKEND
+        except ImportError:
+            continue
+    raise ImportError(f'json backend {name} not installed')
+
+
+set_backend()
+
+
+def decompress(data):
+    """
+    gzip bytes -> bytes, each websocket frame is a complete gzip member so a single zlib call is enough
+    """
+    return zlib.decompress(data, GZIP_WBITS)
+
+
+def decode_frame(data):
+    """
+    :param data: str of a text frame, or gzip compressed bytes of a binary frame
+    :return: decoded json object
+    """
+    if isinstance(data, str):
+        return loads(data)
+    # all backends accept bytes, no intermediate str
+    return loads(decompress(data))
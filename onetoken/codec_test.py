@@ -0,0 +1,21 @@
+import gzip
+import json
+
+import pytest
+
+from . import codec
+
+
+@pytest.mark.parametrize('backend', list(codec.BACKENDS))
+def test_decode_frame(backend):
+    try:
+        codec.set_backend(backend)
+    except ImportError:
+        pytest.skip(f'{backend} not installed')
+    try:
+        msg = {'uri': 'single-tick-verbose', 'data': {'last': 1.5, 'bids': [{'price': 1.4, 'volume': 2}]}}
+        assert codec.decode_frame(json.dumps(msg)) == msg
+        assert codec.decode_frame(gzip.compress(json.dumps(msg).encode())) == msg
+        assert json.loads(codec.dumps(msg)) == msg
+    finally:
+        codec.set_backend()
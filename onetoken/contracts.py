@@ -0,0 +1,208 @@
+"""
+contract metadata registry
+
+    await contracts.registry.prefetch(['okex', 'okef', 'binance'], path='~/.onetoken/contracts.json')
+    con = contracts.registry.get('okef/btc.usd.q')      # sync, O(1)
+    contracts.registry.find(exchange='binance', currency='usdt')
+
+contracts of all exchanges are fetched concurrently and indexed by symbol, exchange, category and currency. With a
+path the registry is written to a json file and read back on the next start before any request, and refresh_loop
+fetches exchanges again once they are older than ttl. quote.get_contract answers from the registry when it knows
+the symbol, quote.get_contracts while the exchange is younger than ttl.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from .logger import log
+from .model import Contract
+
+
+class ContractRegistry:
+    def __init__(self, ttl=3600, concurrency=8):
+        """
+
+        :param ttl: seconds before an exchange is fetched again by refresh_loop
+        :param concurrency: exchanges fetched at the same time
+        """
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.path = None
+        self.by_symbol = {}
+        self.by_exchange = {}
+        self.by_category = {}
+        self.by_currency = {}
+        # exchange -> epoch of the last successful fetch
+        self.fetched = {}
+        self.refresh_task = None
+
+    def __len__(self):
+        return len(self.by_symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self.by_symbol
+
+    @property
+    def exchanges(self):
+        return list(self.by_exchange)
+
+    def get(self, symbol):
+        """
+        :param symbol: okef/btc.usd.q
+        :return: Contract or None
+        """
+        return self.by_symbol.get(symbol)
+
+    def exchange(self, exchange):
+        return list(self.by_exchange.get(exchange, {}).values())
+
+    def category(self, category):
+        return list(self.by_category.get(category, {}).values())
+
+    def currency(self, currency):
+        return list(self.by_currency.get(currency, {}).values())
+
+    def find(self, exchange=None, category=None, currency=None):
+        """
+        contracts matching every given field
+        """
+        indexes = [idx.get(value, {}) for idx, value in [(self.by_exchange, exchange), (self.by_category, category),
+                                                          (self.by_currency, currency)] if value is not None]
+        if not indexes:
+            return list(self.by_symbol.values())
+        indexes.sort(key=len)
+        return [con for symbol, con in indexes[0].items() if all(symbol in idx for idx in indexes[1:])]
+
+    @staticmethod
+    def _index(idx, key, con):
+        if key not in idx:
+            idx[key] = {}
+        idx[key][con.symbol] = con
+
+    @staticmethod
+    def _unindex(idx, key, symbol):
+        bucket = idx.get(key)
+        if bucket is not None:
+            bucket.pop(symbol, None)
+            if not bucket:
+                del idx[key]
+
+    def add(self, con):
+        old = self.by_symbol.get(con.symbol)
+        if old is not None:
+            self._unindex(self.by_category, old.category, old.symbol)
+            self._unindex(self.by_currency, old.currency, old.symbol)
+        self.by_symbol[con.symbol] = con
+        self._index(self.by_exchange, con.exchange, con)
+        self._index(self.by_category, con.category, con)
+        self._index(self.by_currency, con.currency, con)
+
+    def set_exchange(self, exchange, cons, fetched=None):
+        """
+        replace every contract of an exchange
+        """
+        for symbol, con in list(self.by_exchange.get(exchange, {}).items()):
+            self.by_symbol.pop(symbol, None)
+            self._unindex(self.by_category, con.category, symbol)
+            self._unindex(self.by_currency, con.currency, symbol)
+        self.by_exchange.pop(exchange, None)
+        for con in cons:
+            self.add(con)
+        self.fetched[exchange] = time.time() if fetched is None else fetched
+
+    async def fetch(self, exchange):
+        """
+        :return: (list of Contract, err)
+        """
+        from . import quote
+        cons, err = await quote.fetch_contracts(exchange)
+        if err:
+            log.warning('fetch contracts failed', exchange, err)
+            return cons, err
+        self.set_exchange(exchange, cons)
+        return cons, None
+
+    async def prefetch(self, exchanges, path=None):
+        """
+        load the file at path if any, then fetch every exchange concurrently and save
+
+        :param exchanges:
+        :param path: json file of the registry
+        :return: {exchange: err} of failed exchanges
+        """
+        if path is not None:
+            self.path = Path(path).expanduser()
+            self.load()
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(exchange):
+            async with sem:
+                return exchange, (await self.fetch(exchange))[1]
+
+        results = await asyncio.gather(*[one(ex) for ex in exchanges])
+        self.save()
+        return {exchange: err for exchange, err in results if err}
+
+    async def refresh(self, force=False):
+        """
+        fetch again the exchanges older than ttl
+        """
+        now = time.time()
+        stale = [ex for ex, t in self.fetched.items() if force or now - t >= self.ttl]
+        if not stale:
+            return {}
+        return await self.prefetch(stale)
+
+    async def refresh_loop(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                log.exception('refresh contracts failed')
+
+    def start_refresh(self, interval=60):
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.ensure_future(self.refresh_loop(interval))
+
+    def stop_refresh(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            self.refresh_task = None
+
+    def save(self, path=None):
+        path = Path(path).expanduser() if path is not None else self.path
+        if path is None:
+            return
+        data = {'fetched': self.fetched,
+                'contracts': {ex: [con.to_dict() for con in cons.values()] for ex, cons in self.by_exchange.items()}}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        """
+        :return: number of contracts loaded, 0 when the file does not exist or is broken
+        """
+        path = Path(path).expanduser() if path is not None else self.path
+        if path is None or not path.exists():
+            return 0
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            count = 0
+            for exchange, items in data['contracts'].items():
+                cons = [Contract.from_dict(x) for x in items]
+                self.set_exchange(exchange, cons, data['fetched'].get(exchange, 0))
+                count += len(cons)
+            return count
+        except Exception:
+            log.exception('load contracts failed', path)
+            return 0
+
+
+registry = ContractRegistry()
@@ -0,0 +1,98 @@
+import pytest
+
+from . import quote
+from .contracts import ContractRegistry
+from .model import Contract
+
+
+def make(exchange, name, category, currency):
+    return Contract(exchange, name, 0.01, category=category, currency=currency, uid=1)
+
+
+@pytest.mark.asyncio
+async def test_prefetch_index_and_warm_start(tmp_path, monkeypatch):
+    data = {'okef': [make('okef', 'btc.usd.q', 'FUTURES', 'usd'), make('okef', 'eth.usd.q', 'FUTURES', 'usd')],
+            'binance': [make('binance', 'btc.usdt', 'XTC', 'usdt')]}
+    calls = []
+
+    async def get_contracts(exchange):
+        calls.append(exchange)
+        if exchange not in data:
+            return None, 'exchange-not-exist'
+        return list(data[exchange]), None
+
+    monkeypatch.setattr(quote, 'fetch_contracts', get_contracts)
+    path = tmp_path / 'contracts.json'
+    reg = ContractRegistry(ttl=0)
+    errors = await reg.prefetch(['okef', 'binance', 'nope'], path=path)
+    assert errors == {'nope': 'exchange-not-exist'}
+    assert reg.get('okef/btc.usd.q').min_change == 0.01
+    assert sorted(c.symbol for c in reg.find(category='FUTURES')) == ['okef/btc.usd.q', 'okef/eth.usd.q']
+    assert [c.symbol for c in reg.find(exchange='binance', currency='usdt')] == ['binance/btc.usdt']
+    assert reg.find(exchange='okef', currency='usdt') == []
+
+    warm = ContractRegistry()
+    assert warm.load(path) == 3
+    assert warm.get('binance/btc.usdt').to_dict() == reg.get('binance/btc.usdt').to_dict()
+
+    data['okef'] = [make('okef', 'btc.usd.q', 'FUTURES', 'usd')]
+    calls.clear()
+    await reg.refresh()
+    assert sorted(calls) == ['binance', 'okef']
+    assert 'okef/eth.usd.q' not in reg
+    assert reg.by_category['FUTURES'].keys() == {'okef/btc.usd.q'}
+
+
+@pytest.mark.asyncio
+async def test_get_contract_uses_registry(monkeypatch):
+    con = make('okef', 'ltc.usd.q', 'FUTURES', 'usd')
+    quote.contracts.registry.add(con)
+    res, err = await quote.get_contract('okef/ltc.usd.q')
+    assert res is con and err is None
+    quote.contracts.registry.set_exchange('okef', [])
+    quote.contracts.registry.fetched.pop('okef')
+
+
+@pytest.mark.asyncio
+async def test_contracts_bulk_groups_by_exchange(monkeypatch):
+    calls = []
+
+    async def get_contracts(exchange):
+        calls.append(exchange)
+        return [make('huobip', f'coin{i}.usdt', 'XTC', 'usdt') for i in range(5)], None
+
+    async def get_contract(symbol, cached=True):
+        calls.append(symbol)
+        return None, 'contract-not-exist'
+
+    monkeypatch.setattr(quote, 'fetch_contracts', get_contracts)
+    monkeypatch.setattr(quote, 'get_contract', get_contract)
+    symbols = ['huobip/coin1.usdt', 'huobip/coin2.usdt', 'huobip/coin9.usdt', 'okex/foo.usdt']
+    result = await quote.get_contracts_bulk(symbols)
+    assert sorted(calls) == ['huobip', 'okex/foo.usdt']
+    assert result['huobip/coin2.usdt'][0].name == 'coin2.usdt'
+    assert result['huobip/coin9.usdt'] == (None, 'contract-not-exist')
+    assert result['okex/foo.usdt'] == (None, 'contract-not-exist')
+    quote.contracts.registry.set_exchange('huobip', [])
+    quote.contracts.registry.fetched.pop('huobip')
+
+
+@pytest.mark.asyncio
+async def test_get_contracts_served_from_registry_within_ttl(monkeypatch):
+    calls = []
+
+    async def fetch_contracts(exchange):
+        calls.append(exchange)
+        return [make('bitmex', 'xbt.usd', 'FUTURES', 'usd')], None
+
+    monkeypatch.setattr(quote, 'fetch_contracts', fetch_contracts)
+    first, err = await quote.get_contracts('bitmex')
+    second, _ = await quote.get_contracts('bitmex')
+    assert err is None and calls == ['bitmex']
+    assert [c.symbol for c in second] == [c.symbol for c in first] == ['bitmex/xbt.usd']
+    quote.contracts.registry.fetched['bitmex'] -= quote.contracts.registry.ttl
+    await quote.get_contracts('bitmex')
+    await quote.get_contracts('bitmex', cached=False)
+    assert calls == ['bitmex'] * 3
+    quote.contracts.registry.set_exchange('bitmex', [])
+    quote.contracts.registry.fetched.pop('bitmex')
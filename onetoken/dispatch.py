@@ -0,0 +1,123 @@
+"""
+run quote callbacks
+
+every subscription key has its own handle_q task, so messages of one contract are delivered in order while
+different contracts run concurrently. Within a message the callbacks of the key run concurrently as well.
+
+    @offload                      # cpu heavy sync callback, runs in the thread pool
+    def on_tick(tk): ...
+
+    @offload('process')           # picklable top level function, runs in the process pool
+    def fit(tk): ...
+
+    quote.dispatcher = Dispatcher(max_concurrency=50, thread_workers=4)
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .latency import Histogram
+from .logger import log
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+def offload(callback=None, executor=THREAD):
+    """
+    mark a sync callback to run in the dispatcher thread or process pool instead of the event loop
+
+    :param callback:
+    :param executor: 'thread' or 'process'
+    """
+    if isinstance(callback, str):
+        callback, executor = None, callback
+    assert executor in (THREAD, PROCESS), executor
+
+    def mark(cb):
+        cb._ot_offload = executor
+        return cb
+
+    if callback is None:
+        return mark
+    return mark(callback)
+
+
+def callback_name(callback):
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+class Dispatcher:
+    def __init__(self, max_concurrency=None, thread_workers=None, process_workers=None, timing=False):
+        """
+
+        :param max_concurrency: callbacks running at the same time over all subscriptions, None for no limit
+        :param thread_workers: size of the pool of offloaded callbacks, created on first use
+        :param process_workers: size of the pool of callbacks offloaded to processes, created on first use
+        :param timing: keep a duration histogram per callback
+        """
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.executors = {}
+        self.timing = timing
+        self.timings = {}
+        self.errors = 0
+
+    def executor(self, kind):
+        pool = self.executors.get(kind)
+        if pool is None:
+            if kind == PROCESS:
+                pool = ProcessPoolExecutor(self.process_workers)
+            else:
+                pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix='ot-callback')
+            self.executors[kind] = pool
+        return pool
+
+    async def run(self, callbacks, item):
+        """
+        call every callback with item, returns when all of them are done
+        """
+        if len(callbacks) == 1:
+            await self.call(callbacks[0], item)
+        elif callbacks:
+            await asyncio.gather(*[self.call(cb, item) for cb in callbacks])
+
+    async def call(self, callback, item):
+        if self.semaphore is not None:
+            async with self.semaphore:
+                await self._call(callback, item)
+        else:
+            await self._call(callback, item)
+
+    async def _call(self, callback, item):
+        start = time.monotonic() if self.timing else 0.0
+        try:
+            kind = getattr(callback, '_ot_offload', None)
+            if kind is not None:
+                await asyncio.get_event_loop().run_in_executor(self.executor(kind), callback, item)
+            elif asyncio.iscoroutinefunction(callback):
+                await callback(item)
+            else:
+                callback(item)
+        except Exception:
+            self.errors += 1
+            log.exception('quote callback fail')
+        if self.timing:
+            name = callback_name(callback)
+            hist = self.timings.get(name)
+            if hist is None:
+                hist = self.timings[name] = Histogram()
+            hist.record(time.monotonic() - start)
+
+    def stats(self, unit=1e3):
+        """
+        :return: {callback name: histogram dict}
+        """
+        return {name: hist.to_dict(unit) for name, hist in self.timings.items()}
+
+    def close(self, wait=False):
+        for pool in self.executors.values():
+            pool.shutdown(wait=wait)
+        self.executors = {}
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from .dispatch import Dispatcher, offload
+from .quote import TickV3Quote
+
+
+def snapshot(contract, seq):
+    return {'c': contract, 'tp': 's', 'tm': 1552435200.0 + seq, 'l': seq, 'v': 1, 'vc': 1, 'b': [[99, 1]],
+            'a': [[101, 1]]}
+
+
+@pytest.mark.asyncio
+async def test_contracts_run_concurrently_in_order():
+    q = TickV3Quote('test-dispatch', connect=False)
+    got = []
+
+    async def slow(tk):
+        await asyncio.sleep(0.05)
+        got.append((tk.contract, tk.price))
+
+    def fast(tk):
+        got.append((tk.contract, tk.price))
+
+    await q.subscribe_tick_v3('okef/btc.usd.q', slow)
+    await q.subscribe_tick_v3('okef/eth.usd.q', fast)
+    for i in range(3):
+        q.handle_data(snapshot('okef/btc.usd.q', i))
+        q.handle_data(snapshot('okef/eth.usd.q', i))
+    await asyncio.sleep(0.01)
+    assert got == [('okef/eth.usd.q', 0), ('okef/eth.usd.q', 1), ('okef/eth.usd.q', 2)]
+    await asyncio.sleep(0.3)
+    assert [p for c, p in got if c == 'okef/btc.usd.q'] == [0, 1, 2]
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_offload_and_limit():
+    dispatcher = Dispatcher(max_concurrency=2, thread_workers=2, timing=True)
+    threads = set()
+    running = 0
+    peak = 0
+
+    @offload
+    def heavy(item):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.02)
+
+    async def limited(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    ticks = 0
+
+    async def probe():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    task = asyncio.ensure_future(probe())
+    await dispatcher.run([heavy], 1)
+    await asyncio.gather(*[dispatcher.run([limited, limited], i) for i in range(3)])
+    task.cancel()
+    dispatcher.close()
+
+    assert all(name.startswith('ot-callback') for name in threads)
+    # the event loop kept running while heavy slept in the pool
+    assert ticks > 3
+    assert peak == 2
+    stats = dispatcher.stats()
+    assert stats[heavy.__qualname__]['count'] == 1
+    assert stats[heavy.__qualname__]['min'] >= 19
+    assert stats[limited.__qualname__]['count'] == 6
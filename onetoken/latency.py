@@ -0,0 +1,130 @@
+"""
+constant memory latency histograms
+
+values are kept in log-linear buckets (32 per power of two, about 3% precision) from 1 microsecond up to
+about 38 hours, like HdrHistogram
+"""
+SUB_BITS = 5
+SUB = 1 << SUB_BITS
+MAX_US = 1 << 37
+BUCKETS = (MAX_US.bit_length() - SUB_BITS) * SUB + SUB
+
+
+def bucket_index(us):
+    if us < 2 * SUB:
+        return us
+    shift = us.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB + (us >> shift) - SUB
+
+
+def bucket_value(idx):
+    if idx < 2 * SUB:
+        return idx
+    shift = idx // SUB - 1
+    return (idx % SUB + SUB) << shift
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.negative = 0
+
+    def record(self, seconds):
+        """
+        :param seconds: negative values (clock skew between machines) are counted and recorded as 0
+        """
+        if seconds < 0:
+            self.negative += 1
+            seconds = 0.0
+        us = int(seconds * 1e6)
+        if us >= MAX_US:
+            us = MAX_US - 1
+        self.counts[bucket_index(us)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        :param p: 0 - 100
+        :return: seconds, lower bound of the bucket holding the percentile
+        """
+        if not self.count:
+            return None
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return bucket_value(idx) / 1e6
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def reset(self):
+        self.__init__()
+
+    def to_dict(self, unit=1e3):
+        """
+        :param unit: 1e3 -> milliseconds
+        """
+
+        def scale(v):
+            return None if v is None else round(v * unit, 3)
+
+        return {'count': self.count,
+                'mean': scale(self.mean),
+                'min': scale(self.min),
+                'p50': scale(self.percentile(50)),
+                'p90': scale(self.percentile(90)),
+                'p99': scale(self.percentile(99)),
+                'p999': scale(self.percentile(99.9)),
+                'max': scale(self.max),
+                'negative': self.negative}
+
+
+class LatencyStats:
+    """
+    histograms per subscription key and stage
+
+        exchange -> time the exchange stamped to time 1token stamped (exchange_time -> time)
+        network  -> time 1token stamped to frame received by the sdk, wall clock
+        decode   -> frame received to parsed message, monotonic
+        queue    -> parsed message waiting in the subscription queue, monotonic
+        callback -> all callbacks of the subscription for one message, monotonic
+    """
+    STAGES = ['exchange', 'network', 'decode', 'queue', 'callback']
+
+    def __init__(self):
+        self.hists = {}
+
+    def record(self, key, stage, seconds):
+        hists = self.hists.get(key)
+        if hists is None:
+            hists = self.hists[key] = {}
+        hist = hists.get(stage)
+        if hist is None:
+            hist = hists[stage] = Histogram()
+        hist.record(seconds)
+
+    def to_dict(self, contract=None, channel=None, unit=1e3):
+        result = {}
+        for key, hists in self.hists.items():
+            if contract is not None and key[0] != contract:
+                continue
+            if channel is not None and key[1] != channel:
+                continue
+            result[key] = {stage: hists[stage].to_dict(unit) for stage in self.STAGES if stage in hists}
+        return result
+
+    def reset(self):
+        self.hists = {}
@@ -0,0 +1,50 @@
+import asyncio
+import random
+
+import pytest
+
+from .latency import Histogram, bucket_index, bucket_value
+from .quote import TickV3Quote
+from .replay import Replay
+
+
+def test_buckets_are_contiguous():
+    for us in [0, 1, 63, 64, 65, 127, 128, 1000, 123456, 2 ** 30 + 12345]:
+        idx = bucket_index(us)
+        assert bucket_value(idx) <= us < bucket_value(idx + 1)
+        assert (us - bucket_value(idx)) <= max(1, us * 0.04)
+
+
+def test_percentiles():
+    random.seed(5)
+    values = [random.expovariate(1000) for _ in range(10000)]
+    h = Histogram()
+    for v in values:
+        h.record(v)
+    h.record(-0.001)
+    values.append(0)
+    values.sort()
+    assert h.count == 10001
+    assert h.negative == 1
+    for p in [50, 90, 99]:
+        assert h.percentile(p) == pytest.approx(values[int(len(values) * p / 100)], rel=0.05)
+
+
+@pytest.mark.asyncio
+async def test_quote_latency_stages():
+    q = TickV3Quote('test-latency', connect=False)
+    q.enable_latency()
+
+    async def slow(tk):
+        await asyncio.sleep(0.002)
+
+    await q.subscribe_tick_v3('okef/btc.usd.q', slow)
+    frames = [(0, {'c': 'okef/btc.usd.q', 'tp': 's', 'tm': 1552440686.2, 'et': 1552440686.0, 'l': 1, 'v': 1,
+                   'vc': 1, 'b': [[1, 1]], 'a': [[2, 1]]})]
+    await Replay(frames, speed=None).inject(q)
+    await asyncio.sleep(0.05)
+    await q.close()
+    stats = q.latency_stats(contract='okef/btc.usd.q')[('okef/btc.usd.q', q.channel)]
+    assert set(stats) == {'exchange', 'network', 'decode', 'queue', 'callback'}
+    assert stats['exchange']['p50'] == pytest.approx(200, rel=0.05)
+    assert stats['callback']['min'] >= 2
@@ -2,22 +2,30 @@ import json
 import logging
 
 import arrow
-import dateutil
-import dateutil.parser
+
+from .timeparse import parse_datetime, parse_time, parse_epoch, to_datetime
 
 
 class Tick:
     def copy(self):
-        return Tick(time=self.time,
+        tick = Tick(time=self.time,
                     price=self.price,
                     volume=self.volume,
-                    bids=json.loads(json.dumps(self.bids)),
-                    asks=json.loads(json.dumps(self.asks)),
                     contract=self.contract,
                     source=self.source,
                     exchange_time=self.exchange_time,
                     amount=self.amount,
                     )
+        # book levels are immutable and shared, materialized lists are copied level by level
+        if self._bid_levels is not None:
+            tick._bid_levels = self._bid_levels
+        else:
+            tick._bids = [{'price': x['price'], 'volume': x['volume']} for x in self._bids]
+        if self._ask_levels is not None:
+            tick._ask_levels = self._ask_levels
+        else:
+            tick._asks = [{'price': x['price'], 'volume': x['volume']} for x in self._asks]
+        return tick
 
     def __init__(self, time, price, volume=0, bids=None, asks=None, contract=None,
                  source=None,
@@ -25,10 +33,10 @@ class Tick:
                  amount=None,
                  **kwargs):
 
-        # internally use python3's datetime
+        # internally use python3's datetime, or epoch float for quotes created with raw_time
         if isinstance(time, arrow.Arrow):
             time = time.datetime
-        assert time.tzinfo
+        assert isinstance(time, float) or time.tzinfo
         self.contract = contract
         self.source = source
         self.time = time
@@ -40,7 +48,7 @@ class Tick:
         if isinstance(exchange_time, arrow.Arrow):
             exchange_time = exchange_time.datetime
         if exchange_time:
-            assert exchange_time.tzinfo
+            assert isinstance(exchange_time, float) or exchange_time.tzinfo
         self.exchange_time = exchange_time
         if bids:
             self.bids = sorted(bids, key=lambda x: -x['price'])
@@ -52,6 +60,60 @@ class Tick:
             assert 'price' in item and 'volume' in item
             # self.asks = asks
 
+    @classmethod
+    def from_book(cls, time, price, volume, book, contract=None, source=None, exchange_time=None, amount=None):
+        """
+        build tick from an OrderBook, bids/asks are only materialized when read
+        """
+        tick = cls(time, price, volume, contract=contract, source=source, exchange_time=exchange_time, amount=amount)
+        tick._bid_levels, tick._ask_levels = book.snapshot()
+        return tick
+
+    @property
+    def bids(self):
+        if self._bid_levels is not None:
+            self._bids = self._bid_levels.to_list()
+            self._bid_levels = None
+        return self._bids
+
+    @bids.setter
+    def bids(self, value):
+        self._bids = value
+        self._bid_levels = None
+
+    @property
+    def asks(self):
+        if self._ask_levels is not None:
+            self._asks = self._ask_levels.to_list()
+            self._ask_levels = None
+        return self._asks
+
+    @asks.setter
+    def asks(self, value):
+        self._asks = value
+        self._ask_levels = None
+
+    def _top(self, bs):
+        levels = self._bid_levels if bs == 'b' else self._ask_levels
+        if levels is not None:
+            return levels.top()
+        side = self._bids if bs == 'b' else self._asks
+        if side:
+            return side[0]['price'], side[0]['volume']
+        return None
+
+    def levels(self, bs, n):
+        """
+        :param bs: 'b' for bids, 's' for asks
+        :param n:
+        :return: [(price, volume), ...] of the best n levels, without materializing the whole side
+        """
+        levels = self._bid_levels if bs == 'b' else self._ask_levels
+        if levels is not None:
+            return levels.head(n)
+        side = self._bids if bs == 'b' else self._asks
+        return [(x['price'], x['volume']) for x in side[:n]]
+
     # last as an candidate of last
     @property
     def last(self):
@@ -63,21 +125,25 @@ class Tick:
 
     @property
     def bid1(self):
-        if self.bids:
-            return self.bids[0]['price']
+        top = self._top('b')
+        if top:
+            return top[0]
         return None
 
     @property
     def ask1(self):
-        if self.asks:
-            return self.asks[0]['price']
+        top = self._top('s')
+        if top:
+            return top[0]
         return None
 
     @property
     def weighted_middle(self):
-        a = self.bids[0]['price'] * self.asks[0]['volume']
-        b = self.asks[0]['price'] * self.bids[0]['volume']
-        return (a + b) / (self.asks[0]['volume'] + self.bids[0]['volume'])
+        bid_price, bid_volume = self._top('b')
+        ask_price, ask_volume = self._top('s')
+        a = bid_price * ask_volume
+        b = ask_price * bid_volume
+        return (a + b) / (ask_volume + bid_volume)
 
     @property
     def middle(self):
@@ -90,9 +156,12 @@ class Tick:
             return self.asks
 
     def __str__(self):
+        time = self.time
+        if isinstance(time, float):
+            time = arrow.Arrow.utcfromtimestamp(time).datetime
         return '<{} {}.{:03d} {}/{} {} {}>'.format(self.contract,
-                                                   self.time.strftime('%H:%M:%S'),
-                                                   self.time.microsecond // 1000,
+                                                   time.strftime('%H:%M:%S'),
+                                                   time.microsecond // 1000,
                                                    self.bid1,
                                                    self.ask1,
                                                    self.last,
@@ -106,10 +175,10 @@ class Tick:
         return Tick(dct['time'], dct['price'], dct['volume'], dct['bids'], dct['asks'])
 
     def to_dict(self):
-        dct = {'time': self.time.isoformat(), 'price': self.price, 'volume': self.volume, 'asks': self.asks,
-               'bids': self.bids}
+        dct = {'time': to_datetime(self.time).isoformat(), 'price': self.price, 'volume': self.volume,
+               'asks': self.asks, 'bids': self.bids}
         if self.exchange_time:
-            dct['exchange_time'] = self.exchange_time.isoformat()
+            dct['exchange_time'] = to_datetime(self.exchange_time).isoformat()
         if self.contract:
             dct['symbol'] = self.contract
         return dct
@@ -130,7 +199,7 @@ class Tick:
     def to_short_list(self):
         b = ','.join(['{},{}'.format(x['price'], x['volume']) for x in self.bids])
         a = ','.join(['{},{}'.format(x['price'], x['volume']) for x in self.asks])
-        lst = [self.contract, self.time.timestamp(), self.price, self.volume, b, a]
+        lst = [self.contract, parse_epoch(self.time), self.price, self.volume, b, a]
         return lst
 
     @staticmethod
@@ -151,14 +220,19 @@ class Tick:
         return json.dumps(lst)
 
     @classmethod
-    def from_dict(cls, dict_or_str):
+    def from_dict(cls, dict_or_str, raw_time=False):
+        """
+        :param dict_or_str:
+        :param raw_time: keep time and exchange_time as epoch float instead of datetime
+        :return:
+        """
         if isinstance(dict_or_str, str):
-            return cls.from_dict(json.loads(dict_or_str))
+            return cls.from_dict(json.loads(dict_or_str), raw_time)
         d = dict_or_str
         exg_tm = d.get('exchange_time', None)
         if exg_tm is not None:
-            exg_tm = arrow.get(exg_tm)
-        t = Tick(time=arrow.get(d['time']),
+            exg_tm = parse_time(exg_tm, raw_time)
+        t = Tick(time=parse_time(d['time'], raw_time),
                  exchange_time=exg_tm,
                  # contract=ContractApi.get_by_symbol(d['contract']),
                  contract=d['contract'],
@@ -226,6 +300,12 @@ class Contract:
                    data['first_day'], data['last_day'], data['exec_price'], data['currency'],
                    data['id'], data['min_amount'], data['unit_amount'])
 
+    def to_dict(self):
+        return {'exchange': self.exchange, 'name': self.name, 'min_change': self.min_change, 'alias': self.alias,
+                'category': self.category, 'first_day': self.first_day, 'last_day': self.last_day,
+                'exec_price': self.exec_price, 'currency': self.currency, 'id': self.uid,
+                'min_amount': self.min_amount, 'unit_amount': self.unit_amount}
+
 
 class Candle:
     def __init__(self, time, open, high, low, close, volume, contract, duration, amount=None):
@@ -240,8 +320,11 @@ class Candle:
         self.duration = duration
 
     def __str__(self):
+        time = self.time
+        if isinstance(time, float):
+            time = arrow.Arrow.utcfromtimestamp(time)
         return '<Candle-{}:{}-{} {} {} {} {} {} {}>'.format(self.duration, self.contract,
-                                                            self.time.strftime('%H:%M:%S'),
+                                                            time.strftime('%H:%M:%S'),
                                                             self.open, self.high, self.low, self.close, self.volume,
                                                             self.amount)
 
@@ -249,8 +332,17 @@ class Candle:
         return self.__str__()
 
     @classmethod
-    def from_dict(cls, data):
-        return cls(arrow.get(data['time']), data['open'], data['high'], data['low'],
+    def from_dict(cls, data, raw_time=False):
+        """
+        :param data:
+        :param raw_time: keep time as epoch float instead of arrow
+        :return:
+        """
+        if raw_time:
+            tm = parse_time(data['time'], raw_time)
+        else:
+            tm = arrow.Arrow.fromdatetime(parse_datetime(data['time']))
+        return cls(tm, data['open'], data['high'], data['low'],
                    data['close'], data['volume'], data['contract'], data['duration'], data.get('amount', None))
 
 
@@ -270,9 +362,14 @@ class Zhubi:
         return self.__str__()
 
     @classmethod
-    def from_dict(cls, data):
-        return cls(arrow.get(data['time']).datetime, arrow.get(data['exchange_time']).datetime, data['contract'], data['price'],
-                   data['amount'], data['bs'])
+    def from_dict(cls, data, raw_time=False):
+        """
+        :param data:
+        :param raw_time: keep time and exchange_time as epoch float instead of datetime
+        :return:
+        """
+        return cls(parse_time(data['time'], raw_time), parse_time(data['exchange_time'], raw_time), data['contract'],
+                   data['price'], data['amount'], data['bs'])
 
 
 class Info:
@@ -380,9 +477,9 @@ class Order:
                   average_dealt_price=dct.get('average_dealt_price', 0),
                   bs=dct['bs'],
                   entrust_amount=dct['entrust_amount'],
-                  entrust_time=dateutil.parser.parse(dct['entrust_time']),
+                  entrust_time=parse_datetime(dct['entrust_time'], default_tz=None),
                   account_symbol=dct['account'],
-                  last_update=dateutil.parser.parse(dct['last_update']),
+                  last_update=parse_datetime(dct['last_update'], default_tz=None),
                   exg_oid=dct['exchange_oid'],
                   client_oid=dct['client_oid'],
                   status=dct['status'],
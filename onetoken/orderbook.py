@@ -0,0 +1,192 @@
+"""
+incremental order book used by the tick-v3 feed
+
+each side keeps its levels in small sorted chunks, a snapshot only copies the chunk references and a chunk is
+copied on the next write to it (copy-on-write), so issuing a new Tick costs O(changed chunks) and older ticks
+keep seeing the levels they were built from
+"""
+import bisect
+
+CHUNK_SIZE = 16
+
+
+class Levels:
+    """
+    frozen view of one book side, materialized to the [{'price': p, 'volume': v}, ...] list lazily
+    """
+
+    def __init__(self, prices, volumes, reverse):
+        """
+
+        :param prices: tuple of ascending price chunks
+        :param volumes: tuple of volume chunks aligned with prices
+        :param reverse: True for bids, the best level is the last one
+        """
+        self.prices = prices
+        self.volumes = volumes
+        self.reverse = reverse
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.prices)
+
+    def top(self):
+        """
+        :return: (price, volume) of the best level, or None if side is empty
+        """
+        if not self.prices:
+            return None
+        if self.reverse:
+            return self.prices[-1][-1], self.volumes[-1][-1]
+        return self.prices[0][0], self.volumes[0][0]
+
+    def head(self, n):
+        """
+        :return: [(price, volume), ...] of the best n levels
+        """
+        result = []
+        if self.reverse:
+            for prices, volumes in zip(reversed(self.prices), reversed(self.volumes)):
+                result.extend(zip(reversed(prices[-n:]), reversed(volumes[-n:])))
+                if len(result) >= n:
+                    break
+        else:
+            for prices, volumes in zip(self.prices, self.volumes):
+                result.extend(zip(prices[:n], volumes[:n]))
+                if len(result) >= n:
+                    break
+        return result[:n]
+
+    def to_list(self):
+        if self.reverse:
+            return [{'price': p, 'volume': v}
+                    for prices, volumes in zip(reversed(self.prices), reversed(self.volumes))
+                    for p, v in zip(reversed(prices), reversed(volumes))]
+        return [{'price': p, 'volume': v}
+                for prices, volumes in zip(self.prices, self.volumes)
+                for p, v in zip(prices, volumes)]
+
+
+class BookSide:
+    """
+    price levels in ascending price chunks, bids read them from the end
+    """
+
+    def __init__(self, reverse=False):
+        self.reverse = reverse
+        self._prices = []
+        self._volumes = []
+        self._maxes = []
+        # chunks created since the last snapshot, only those may be written in place
+        self._owned = []
+        self._snapshot = None
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._prices)
+
+    def load(self, levels):
+        # a price repeated in a snapshot is one level, the last volume wins
+        levels = sorted((p, v) for p, v in dict(levels).items() if v > 0)
+        self._prices = [[p for p, _ in levels[i:i + CHUNK_SIZE]] for i in range(0, len(levels), CHUNK_SIZE)]
+        self._volumes = [[v for _, v in levels[i:i + CHUNK_SIZE]] for i in range(0, len(levels), CHUNK_SIZE)]
+        self._maxes = [chunk[-1] for chunk in self._prices]
+        self._owned = [True] * len(self._prices)
+        self._snapshot = None
+
+    def _own(self, i):
+        if not self._owned[i]:
+            self._prices[i] = self._prices[i][:]
+            self._volumes[i] = self._volumes[i][:]
+            self._owned[i] = True
+
+    def _set(self, p, v):
+        maxes = self._maxes
+        if not maxes:
+            if v > 0:
+                self._prices.append([p])
+                self._volumes.append([v])
+                maxes.append(p)
+                self._owned.append(True)
+            return
+        i = bisect.bisect_left(maxes, p)
+        if i == len(maxes):
+            i -= 1
+        prices = self._prices[i]
+        j = bisect.bisect_left(prices, p)
+        found = j < len(prices) and prices[j] == p
+        if v > 0:
+            self._own(i)
+            prices, volumes = self._prices[i], self._volumes[i]
+            if found:
+                volumes[j] = v
+                return
+            prices.insert(j, p)
+            volumes.insert(j, v)
+            maxes[i] = prices[-1]
+            if len(prices) > CHUNK_SIZE * 2:
+                self._prices.insert(i + 1, prices[CHUNK_SIZE:])
+                self._volumes.insert(i + 1, volumes[CHUNK_SIZE:])
+                del prices[CHUNK_SIZE:]
+                del volumes[CHUNK_SIZE:]
+                maxes[i] = prices[-1]
+                maxes.insert(i + 1, self._prices[i + 1][-1])
+                self._owned.insert(i + 1, True)
+        elif found:
+            self._own(i)
+            prices, volumes = self._prices[i], self._volumes[i]
+            del prices[j]
+            del volumes[j]
+            if prices:
+                maxes[i] = prices[-1]
+            else:
+                del self._prices[i]
+                del self._volumes[i]
+                del maxes[i]
+                del self._owned[i]
+
+    def update(self, levels):
+        for p, v in levels:
+            self._set(p, v)
+        self._snapshot = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = Levels(tuple(self._prices), tuple(self._volumes), self.reverse)
+            self._owned = [False] * len(self._prices)
+        return self._snapshot
+
+    def top(self):
+        if not self._prices:
+            return None
+        if self.reverse:
+            return self._prices[-1][-1], self._volumes[-1][-1]
+        return self._prices[0][0], self._volumes[0][0]
+
+
+class OrderBook:
+    def __init__(self, bids=None, asks=None):
+        """
+
+        :param bids: [[price, volume], ...]
+        :param asks: [[price, volume], ...]
+        """
+        self.bids = BookSide(reverse=True)
+        self.asks = BookSide()
+        if bids:
+            self.bids.load(bids)
+        if asks:
+            self.asks.load(asks)
+
+    def update(self, bids, asks):
+        """
+        apply delta levels in place, volume 0 removes the level
+        """
+        if bids:
+            self.bids.update(bids)
+        if asks:
+            self.asks.update(asks)
+
+    def snapshot(self):
+        """
+        :return: (bid Levels, ask Levels) unaffected by later updates
+        """
+        return self.bids.snapshot(), self.asks.snapshot()
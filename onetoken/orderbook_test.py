@@ -0,0 +1,74 @@
+import random
+from datetime import datetime, timezone
+
+from .model import Tick
+from .orderbook import OrderBook
+
+
+def naive_update(levels, delta, reverse):
+    book = {item['price']: item['volume'] for item in levels}
+    book.update({p: v for p, v in delta})
+    levels = [{'price': p, 'volume': v} for p, v in book.items() if v > 0]
+    return sorted(levels, key=lambda x: x['price'], reverse=reverse)
+
+
+def test_update_matches_full_resort():
+    random.seed(1)
+    bids = [[100 - i * 0.5, 1 + i] for i in range(20)]
+    asks = [[100.5 + i * 0.5, 1 + i] for i in range(20)]
+    book = OrderBook(bids, asks)
+    expect_bids = naive_update([], bids, True)
+    expect_asks = naive_update([], asks, False)
+    for _ in range(500):
+        db = [[random.randint(160, 200) * 0.5, random.choice([0, 0, 1, 2.5])] for _ in range(3)]
+        da = [[random.randint(201, 240) * 0.5, random.choice([0, 0, 1, 2.5])] for _ in range(3)]
+        book.update(db, da)
+        expect_bids = naive_update(expect_bids, db, True)
+        expect_asks = naive_update(expect_asks, da, False)
+        bid_levels, ask_levels = book.snapshot()
+        assert bid_levels.to_list() == expect_bids
+        assert ask_levels.to_list() == expect_asks
+
+
+def test_tick_from_book_is_not_mutated_by_later_updates():
+    now = datetime.now(timezone.utc)
+    book = OrderBook([[10, 1], [9, 2]], [[11, 3], [12, 4]])
+    tick = Tick.from_book(now, 10.5, 100, book, 'okef/btc.usd.q', 'tick.v3')
+    book.update([[10, 0], [9.5, 5]], [[11, 1]])
+    assert tick.bid1 == 10
+    assert tick.ask1 == 11
+    assert tick.weighted_middle == (10 * 3 + 11 * 1) / 4
+    assert tick.bids == [{'price': 10, 'volume': 1}, {'price': 9, 'volume': 2}]
+    assert tick.asks == [{'price': 11, 'volume': 3}, {'price': 12, 'volume': 4}]
+
+    tick = Tick.from_book(now, 10.5, 100, book, 'okef/btc.usd.q', 'tick.v3')
+    assert tick.bid1 == 9.5
+    assert tick.bids == [{'price': 9.5, 'volume': 5}, {'price': 9, 'volume': 2}]
+    assert tick.asks[0] == {'price': 11, 'volume': 1}
+
+
+def test_snapshots_share_unchanged_chunks():
+    random.seed(2)
+    book = OrderBook([[100 - i, 1] for i in range(100)], [[101 + i, 1] for i in range(100)])
+    history = []
+    for _ in range(300):
+        db = [[random.randint(1, 100), random.choice([0, 1, 3])] for _ in range(2)]
+        book.update(db, [])
+        bids, asks = book.snapshot()
+        history.append((bids, bids.to_list(), asks))
+    for bids, expect, asks in history:
+        # later writes went to private copies of the chunks
+        assert bids.to_list() == expect
+        assert asks is history[0][2]
+    last, prev = history[-1][0], history[-2][0]
+    shared = sum(1 for a, b in zip(last.prices, prev.prices) if a is b)
+    assert shared >= len(last.prices) - 2
+
+
+def test_snapshot_repeated_price_is_one_level():
+    book = OrderBook([[10, 1], [9, 2], [10, 3]], [[11, 1], [11, 0]])
+    bids, asks = book.snapshot()
+    assert bids.to_list() == [{'price': 10, 'volume': 3}, {'price': 9, 'volume': 2}]
+    assert asks.to_list() == []
+    book.update([[10, 0]], [])
+    assert book.snapshot()[0].to_list() == [{'price': 9, 'volume': 2}]
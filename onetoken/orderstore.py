@@ -0,0 +1,140 @@
+"""
+local index of the orders of an account, kept up to date by the order pushes of the account websocket
+
+    await acc.subscribe_orders()
+    await acc.sync_orders()          # seed with the open orders from REST once
+    acc.orders.get('okex/btc.usdt-123')
+    acc.orders.open('okex/btc.usdt')
+
+orders are the pushed dicts. A push with a lower version than the stored order (or the same version and less dealt)
+is stale and discarded. Orders in an end status are kept for retention seconds and then evicted.
+"""
+import time
+from collections import deque
+
+from .model import Order
+
+
+class OrderStore:
+    def __init__(self, retention=60):
+        """
+
+        :param retention: seconds an order in Order.END_STATUSES stays queryable
+        """
+        self.retention = retention
+        self.by_exchange_oid = {}
+        self.by_client_oid = {}
+        self.by_contract = {}
+        self.by_status = {}
+        self.ended = deque()
+        self.applied = 0
+        self.stale = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.by_exchange_oid)
+
+    def __contains__(self, exchange_oid):
+        return exchange_oid in self.by_exchange_oid
+
+    def get(self, exchange_oid):
+        return self.by_exchange_oid.get(exchange_oid)
+
+    def get_by_client_oid(self, client_oid):
+        return self.by_client_oid.get(client_oid)
+
+    def with_status(self, *statuses):
+        """
+        :param statuses: Order.PENDING, ...
+        """
+        return [o for status in statuses for o in self.by_status.get(status, {}).values()]
+
+    def of_contract(self, contract):
+        return list(self.by_contract.get(contract, {}).values())
+
+    def open(self, contract=None):
+        """
+        orders in Order.ACTIVE_STATUS, of one contract if given
+        """
+        if contract is None:
+            return self.with_status(*Order.ACTIVE_STATUS)
+        return [o for o in self.by_contract.get(contract, {}).values() if o['status'] not in Order.END_STATUSES]
+
+    @staticmethod
+    def _add(idx, key, oid, order):
+        if key not in idx:
+            idx[key] = {}
+        idx[key][oid] = order
+
+    @staticmethod
+    def _remove(idx, key, oid):
+        bucket = idx.get(key)
+        if bucket is not None:
+            bucket.pop(oid, None)
+            if not bucket:
+                del idx[key]
+
+    def is_stale(self, old, order):
+        version, old_version = order.get('version') or 0, old.get('version') or 0
+        if version != old_version:
+            return version < old_version
+        return (order.get('dealt_amount') or 0) < (old.get('dealt_amount') or 0)
+
+    def apply(self, order):
+        """
+        :param order: pushed order dict
+        :return: False if the update was stale and discarded
+        """
+        oid = order['exchange_oid']
+        old = self.by_exchange_oid.get(oid)
+        if old is not None:
+            if self.is_stale(old, order):
+                self.stale += 1
+                return False
+            self._remove(self.by_status, old['status'], oid)
+            self._remove(self.by_contract, old['contract'], oid)
+        self.by_exchange_oid[oid] = order
+        if order.get('client_oid'):
+            self.by_client_oid[order['client_oid']] = order
+        self._add(self.by_contract, order['contract'], oid, order)
+        self._add(self.by_status, order['status'], oid, order)
+        if order['status'] in Order.END_STATUSES and (old is None or old['status'] not in Order.END_STATUSES):
+            self.ended.append((time.monotonic(), oid))
+        self.applied += 1
+        self.evict()
+        return True
+
+    def load(self, orders):
+        """
+        apply a list of order dicts, e.g. the result of Account.get_pending_list
+        """
+        for order in orders:
+            self.apply(order)
+
+    def discard(self, exchange_oid):
+        order = self.by_exchange_oid.pop(exchange_oid, None)
+        if order is None:
+            return
+        if order.get('client_oid') and self.by_client_oid.get(order['client_oid']) is order:
+            del self.by_client_oid[order['client_oid']]
+        self._remove(self.by_contract, order['contract'], exchange_oid)
+        self._remove(self.by_status, order['status'], exchange_oid)
+
+    def evict(self, now=None):
+        """
+        drop ended orders older than retention
+        """
+        if not self.ended:
+            return
+        if now is None:
+            now = time.monotonic()
+        deadline = now - self.retention
+        while self.ended and self.ended[0][0] <= deadline:
+            _, oid = self.ended.popleft()
+            order = self.by_exchange_oid.get(oid)
+            if order is not None and order['status'] in Order.END_STATUSES:
+                self.discard(oid)
+                self.evicted += 1
+
+    def clear(self):
+        self.__init__(self.retention)
@@ -0,0 +1,31 @@
+from .model import Order
+from .orderstore import OrderStore
+
+
+def order(oid, status, version, dealt=0, contract='okex/btc.usdt', client_oid=None):
+    return {'exchange_oid': oid, 'client_oid': client_oid or f'c-{oid}', 'contract': contract, 'status': status,
+            'version': version, 'dealt_amount': dealt}
+
+
+def test_apply_and_query():
+    store = OrderStore(retention=10)
+    store.apply(order('1', Order.PENDING, 1))
+    store.apply(order('2', Order.PENDING, 1, contract='okex/eth.usdt'))
+    assert store.apply(order('1', Order.PART_DEAL_PENDING, 2, dealt=1))
+    assert not store.apply(order('1', Order.PENDING, 1))
+    assert not store.apply(order('1', Order.PART_DEAL_PENDING, 2, dealt=0.5))
+    assert store.stale == 2
+    assert store.get('1')['status'] == Order.PART_DEAL_PENDING
+    assert store.get_by_client_oid('c-2')['exchange_oid'] == '2'
+    assert [o['exchange_oid'] for o in store.open('okex/btc.usdt')] == ['1']
+    assert store.with_status(Order.PENDING) == [store.get('2')]
+    assert len(store.open()) == 2
+
+    store.apply(order('1', Order.DEALT, 3, dealt=2))
+    assert store.open('okex/btc.usdt') == []
+    assert store.with_status(Order.DEALT) == [store.get('1')]
+    store.evict(now=store.ended[0][0] + 11)
+    assert '1' not in store
+    assert store.get_by_client_oid('c-1') is None
+    assert 'okex/btc.usdt' not in store.by_contract
+    assert store.evicted == 1 and len(store) == 1
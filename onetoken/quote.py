@@ -1,17 +1,44 @@
 import asyncio
-import json
+import time
+import zlib
 from collections import defaultdict
 
 import aiohttp
 import arrow
 
+from . import autil
+from . import codec
+from . import contracts
 from .config import Config
+from .dispatch import Dispatcher
+from .latency import LatencyStats
 from .logger import log
 from .model import Tick, Contract, Candle, Zhubi
+from .orderbook import OrderBook
+from .tickcache import last_ticks
+from .timeparse import parse_time, parse_epoch
+
+
+ALL = 'all'
+LATEST = 'latest'
+DROP_OLDEST = 'drop-oldest'
+DELIVERY_POLICIES = [ALL, LATEST, DROP_OLDEST]
+# queue size of drop-oldest delivery
+MAXSIZE = 1000
+
+# parsed data of messages a parser drops on purpose, e.g. deltas of a book waiting for its snapshot
+SKIPPED = 'skipped'
 
 
 class Quote:
-    def __init__(self, key, ws_url, data_parser):
+    def __init__(self, key, ws_url, data_parser, connect=True):
+        """
+
+        :param key:
+        :param ws_url:
+        :param data_parser: data message -> (q_key, parsed_data)
+        :param connect: False for an offline quote fed through handle_data, e.g. by replay.Replay.inject
+        """
         self.key = key
         self.ws_url = ws_url
         self.data_parser = data_parser
@@ -19,14 +46,31 @@ class Quote:
         self.ws = None
         self.queue_handlers = defaultdict(list)
         self.data_queue = {}
-        self.connected = False
-        self.authorized = False
+        self.sub_params = {}
+        self.delivery = {}
+        # called with (q_key, parsed_data) for every parsed message, e.g. Recorder.on_data
+        self.taps = []
+        # called with every decoded data message before parsing, e.g. replay.FrameRecorder.on_frame
+        self.raw_taps = []
+        self.offline = not connect
+        self.connected = self.offline
+        self.authorized = self.offline
+        # put parsed ticks in the process wide last_ticks, off for offline quotes so replayed ticks are not taken
+        # as fresh by get_last_tick and peek
+        self.cache_last_tick = not self.offline
         self.lock = asyncio.Lock()
-        self.ensure_connection = True
+        self.ensure_connection = connect
         self.pong = 0
+        # per stage latency histograms, None until enable_latency
+        self.latency = None
+        # runs the callbacks of handle_q, may be replaced or shared between quotes
+        self.dispatcher = Dispatcher()
+        # False when the dispatcher is shared, e.g. by a QuotePool, and shut down by its owner
+        self.owns_dispatcher = True
         self.task_list = []
-        self.task_list.append(asyncio.ensure_future(self.ensure_connected()))
-        self.task_list.append(asyncio.ensure_future(self.heart_beat_loop()))
+        if connect:
+            self.task_list.append(asyncio.ensure_future(self.ensure_connected()))
+            self.task_list.append(asyncio.ensure_future(self.heart_beat_loop()))
 
     async def ensure_connected(self):
         log.debug('Connecting to {}'.format(self.ws_url))
@@ -51,6 +95,7 @@ class Quote:
                     sleep_seconds = min(sleep_seconds * 2, 64)
                 else:
                     log.debug('Connected to WS')
+                    self.on_reconnect()
                     self.connected = True
                     sleep_seconds = 2
                     self.pong = arrow.now().timestamp
@@ -67,11 +112,17 @@ class Quote:
                         if q_keys:
                             log.info('recover subscriptions', q_keys)
                             for q_key in q_keys:
-                                sub_data = json.loads(q_key)
+                                sub_data = self.sub_params[q_key]
                                 asyncio.ensure_future(self.subscribe_data(**sub_data))
             else:
                 await asyncio.sleep(1)
 
+    def on_reconnect(self):
+        """
+        called on every new websocket connection before the subscriptions are recovered, drop the state built from
+        the messages of the previous connection
+        """
+
     async def heart_beat_loop(self):
         while True:
             try:
@@ -89,30 +140,11 @@ class Quote:
             msg = await self.ws.receive()
             try:
                 if msg.type == aiohttp.WSMsgType.BINARY or msg.type == aiohttp.WSMsgType.TEXT:
-                    import gzip
-                    if msg.type == aiohttp.WSMsgType.TEXT:
-                        data = json.loads(msg.data)
+                    if self.latency is not None:
+                        received = time.monotonic(), time.time()
+                        self.handle_data(codec.decode_frame(msg.data), received)
                     else:
-                        data = json.loads(gzip.decompress(msg.data).decode())
-                    uri = data.get('uri', 'data')
-                    if uri == 'pong':
-                        self.pong = arrow.now().timestamp
-                    elif uri == 'auth':
-                        log.info(data)
-                        self.authorized = True
-                    elif uri == 'subscribe-single-tick-verbose':
-                        log.info(data)
-                    elif uri == 'subscribe-single-zhubi-verbose':
-                        log.info(data)
-                    elif uri == 'subscribe-single-candle':
-                        log.info(data)
-                    else:
-                        q_key, parsed_data = self.data_parser(data)
-                        if q_key is None:
-                            log.warning('unknown message', data)
-                            continue
-                        if q_key in self.data_queue:
-                            self.data_queue[q_key].put_nowait(parsed_data)
+                        self.handle_data(codec.decode_frame(msg.data))
                 elif msg.type == aiohttp.WSMsgType.CLOSED:
                     log.warning('closed', msg)
                     break
@@ -130,168 +162,534 @@ class Quote:
         self.authorized = False
         log.warning('ws was disconnected...')
 
-    async def subscribe_data(self, uri, on_update=None, **kwargs):
+    def handle_data(self, data, received=None):
+        """
+        dispatch one decoded message, data messages are parsed and routed to the subscription queue
+
+        :param data:
+        :param received: (monotonic, wall) time the frame was received, for latency stats
+        """
+        uri = data.get('uri', 'data')
+        if uri == 'pong':
+            self.pong = arrow.now().timestamp
+        elif uri == 'auth':
+            log.info(data)
+            self.authorized = True
+        elif uri == 'subscribe-single-tick-verbose':
+            log.info(data)
+        elif uri == 'subscribe-single-zhubi-verbose':
+            log.info(data)
+        elif uri == 'subscribe-single-candle':
+            log.info(data)
+        else:
+            for tap in self.raw_taps:
+                tap(data)
+            q_key, parsed_data = self.data_parser(data)
+            if q_key is None:
+                if parsed_data is not SKIPPED:
+                    log.warning('unknown message', data)
+                return
+            for tap in self.taps:
+                tap(q_key, parsed_data)
+            enqueued = 0.0
+            if self.latency is not None:
+                enqueued = time.monotonic()
+                self.record_receive_latency(q_key, parsed_data, received, enqueued)
+            if q_key in self.data_queue:
+                self.data_queue[q_key].put_nowait((enqueued, parsed_data))
+
+    def record_receive_latency(self, q_key, parsed_data, received, now):
+        if received is None:
+            received = now, time.time()
+        self.latency.record(q_key, 'decode', now - received[0])
+        item = parsed_data[0] if isinstance(parsed_data, list) else parsed_data
+        if isinstance(item, Candle):
+            # candle time is the bar start
+            return
+        tm = getattr(item, 'time', None)
+        exchange_time = getattr(item, 'exchange_time', None)
+        if tm is not None:
+            tm = parse_epoch(tm)
+            self.latency.record(q_key, 'network', received[1] - tm)
+            if exchange_time is not None:
+                self.latency.record(q_key, 'exchange', tm - parse_epoch(exchange_time))
+
+    def enable_latency(self, enable=True):
+        """
+        start (or stop) timing every message through exchange -> network -> decode -> queue -> callback
+        """
+        if enable:
+            if self.latency is None:
+                self.latency = LatencyStats()
+        else:
+            self.latency = None
+        self.dispatcher.timing = enable
+
+    def callback_stats(self, unit=1e3):
+        """
+        :return: {callback name: {'count', 'mean', ..., 'max'}} duration of each callback, needs enable_latency
+        """
+        return self.dispatcher.stats(unit)
+
+    def latency_stats(self, contract=None, channel=None, unit=1e3):
+        """
+        :param contract: only this contract
+        :param channel: only this subscription uri
+        :param unit: 1e3 -> milliseconds
+        :return: {q_key: {stage: {'count', 'mean', 'min', 'p50', 'p90', 'p99', 'p999', 'max', 'negative'}}}
+        """
+        if self.latency is None:
+            return {}
+        return self.latency.to_dict(contract, channel, unit)
+
+    async def subscribe_data(self, uri, on_update=None, delivery=ALL, maxsize=MAXSIZE, **kwargs):
+        """
+        :param uri:
+        :param on_update:
+        :param delivery: how queued messages reach on_update, fixed by the first subscription of a key
+            all -> every message in order, queue is unbounded
+            latest -> only the newest message, unread ones are conflated
+            drop-oldest -> at most maxsize messages, the oldest is dropped when full
+        :param maxsize: queue size of drop-oldest delivery
+        :param kwargs: sent to the server with the subscription
+        :return:
+        """
+        assert delivery in DELIVERY_POLICIES, delivery
         log.info('subscribe', uri, **kwargs)
         while not self.connected or not self.authorized:
             await asyncio.sleep(1)
         sub_data = {'uri': uri}
         sub_data.update(kwargs)
-        q_key = json.dumps(sub_data, sort_keys=True)
+        q_key = self.make_q_key(**sub_data)
 
         async with self.lock:
             try:
-                await self.ws.send_json(sub_data)
+                if not self.offline:
+                    await self.ws.send_json(sub_data)
                 log.info('sub data', sub_data)
                 if q_key not in self.data_queue:
-                    self.data_queue[q_key] = asyncio.Queue()
+                    self.sub_params[q_key] = sub_data
+                    self.delivery[q_key] = delivery
+                    self.data_queue[q_key] = self.new_queue(delivery, maxsize)
                     if on_update:
                         if not self.queue_handlers[q_key]:
-                            asyncio.ensure_future(self.handle_q(q_key))
+                            self.task_list.append(asyncio.ensure_future(self.handle_q(q_key)))
             except Exception as e:
                 log.warning('subscribe {} failed...'.format(kwargs), e)
             else:
                 if on_update:
                     self.queue_handlers[q_key].append(on_update)
 
+    @staticmethod
+    def new_queue(delivery, maxsize):
+        if delivery == LATEST:
+            return autil.LatestQueue()
+        if delivery == DROP_OLDEST:
+            return autil.DropOldestQueue(maxsize)
+        return asyncio.Queue()
+
+    def _discarded(self, delivery):
+        return sum(q.discarded for q_key, q in self.data_queue.items() if self.delivery.get(q_key) == delivery)
+
+    @property
+    def conflated(self):
+        """
+        messages replaced by a newer one before delivery, over all latest subscriptions
+        """
+        return self._discarded(LATEST)
+
+    @property
+    def dropped(self):
+        """
+        messages dropped from full queues, over all drop-oldest subscriptions
+        """
+        return self._discarded(DROP_OLDEST)
+
+    def delivery_stats(self):
+        """
+        :return: {q_key: {'delivery': ..., 'qsize': ..., 'conflated': ..., 'dropped': ...}}
+        """
+        stats = {}
+        for q_key, q in self.data_queue.items():
+            delivery = self.delivery.get(q_key, ALL)
+            discarded = getattr(q, 'discarded', 0)
+            stats[q_key] = {'delivery': delivery,
+                            'qsize': q.qsize(),
+                            'conflated': discarded if delivery == LATEST else 0,
+                            'dropped': discarded if delivery == DROP_OLDEST else 0}
+        return stats
+
+    @staticmethod
+    def make_q_key(uri, contract=None, duration=None, **kwargs):
+        """
+        routing key of a subscription, parsers build the same tuple from each message
+        """
+        if duration is None:
+            return contract, uri
+        return contract, uri, duration
+
     async def handle_q(self, q_key):
         while q_key in self.data_queue:
             q = self.data_queue[q_key]
             try:
-                tk = await q.get()
+                enqueued, tk = await q.get()
+            except asyncio.CancelledError:
+                break
             except:
                 log.warning('get data from queue failed')
                 continue
-            for callback in self.queue_handlers[q_key]:
-                if asyncio.iscoroutinefunction(callback):
-                    try:
-                        await callback(tk)
-                    except:
-                        log.exception('quote callback fail')
-                else:
-                    try:
-                        callback(tk)
-                    except:
-                        log.exception('quote callback fail')
+            latency = self.latency
+            if latency is not None and enqueued:
+                start = time.monotonic()
+                latency.record(q_key, 'queue', start - enqueued)
+            await self.dispatcher.run(self.queue_handlers[q_key], tk)
+            if latency is not None and enqueued:
+                latency.record(q_key, 'callback', time.monotonic() - start)
 
     async def close(self):
         self.ensure_connection = False
         for task in self.task_list:
             task.cancel()
+        if self.owns_dispatcher:
+            self.dispatcher.close()
         if self.sess:
             await self.sess.close()
 
 
 class TickQuote(Quote):
-    def __init__(self, key):
-        super().__init__(key, Config.TICK_HOST_WS, self.parse_tick)
+    def __init__(self, key, raw_time=False, connect=True):
+        """
+        :param key:
+        :param raw_time: keep tick times as epoch float instead of datetime
+        :param connect:
+        """
+        super().__init__(key, Config.TICK_HOST_WS, self.parse_tick, connect)
         self.channel = 'subscribe-single-tick-verbose'
+        self.raw_time = raw_time
 
     def parse_tick(self, data):
         try:
-            tick = Tick.from_dict(data['data'])
-            q_key = json.dumps({'contract': tick.contract, 'uri': self.channel}, sort_keys=True)
+            tick = Tick.from_dict(data['data'], self.raw_time)
+            if self.cache_last_tick:
+                last_ticks.update(tick)
+            q_key = tick.contract, self.channel
             return q_key, tick
         except Exception as e:
             log.warning('parse error', e)
         return None, None
 
-    async def subscribe_tick(self, contract, on_update):
-        await self.subscribe_data(self.channel, on_update=on_update, contract=contract)
+    async def subscribe_tick(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.subscribe_data(self.channel, on_update=on_update, delivery=delivery, maxsize=maxsize,
+                                  contract=contract)
 
 
 class TickV3Quote(Quote):
-    def __init__(self):
-        super().__init__('tick.v3', Config.TICK_V3_HOST_WS, self.parse_tick)
+    def __init__(self, key='tick.v3', raw_time=False, connect=True, check_crossed=True, checksum=None,
+                 resnapshot_timeout=5, resnapshot_retries=3):
+        """
+        :param key:
+        :param raw_time: keep tick times as epoch float instead of datetime
+        :param connect:
+        :param check_crossed: a delta leaving best bid >= best ask invalidates the book
+        :param checksum: (book, expected) -> bool, checked when a message carries 'cs'
+        :param resnapshot_timeout: seconds to wait for the snapshot after resubscribing a broken book
+        :param resnapshot_retries: resubscriptions of a broken book before reconnecting the websocket, the timeout
+            doubles after each one up to 64 seconds
+        """
+        super().__init__(key, Config.TICK_V3_HOST_WS, self.parse_tick, connect)
         self.channel = 'subscribe-single-tick-verbose'
+        self.raw_time = raw_time
         print(Config.TICK_V3_HOST_WS)
         self.ticks = {}
+        self.books = {}
+        self.check_crossed = check_crossed
+        self.checksum = checksum
+        self.resnapshot_timeout = resnapshot_timeout
+        self.resnapshot_retries = resnapshot_retries
+        self.seqs = {}
+        # contract -> Event set when a fresh snapshot arrives, deltas of these contracts are discarded
+        self.stale = {}
+        # contract -> {'gap', 'crossed', 'checksum', 'early', 'discarded', 'resnapshot', 'reconnect', 'recovered': count}
+        self.integrity = defaultdict(lambda: defaultdict(int))
 
     def parse_tick(self, data):
         try:
             c = data['c']
-            tm = arrow.get(data['tm'])
-            et = arrow.get(data['et']) if 'et' in data else None
             tp = data['tp']
-            q_key = json.dumps({'contract': c, 'uri': self.channel}, sort_keys=True)
+            q_key = c, self.channel
+            seq = data.get('seq')
             if tp == 's':
-                bids = [{'price': p, 'volume': v} for p, v in data['b']]
-                asks = [{'price': p, 'volume': v} for p, v in data['a']]
-                tick = Tick(tm, data['l'], data['v'], bids, asks, c, 'tick.v3', et, data['vc'])
-                self.ticks[tick.contract] = tick
-                return q_key, tick
+                book = OrderBook(data['b'], data['a'])
+                self.books[c] = book
+                if c in self.stale:
+                    self.integrity[c]['recovered'] += 1
+                    self.stale.pop(c).set()
             elif tp == 'd':
-                if c not in self.ticks:
-                    log.warning('update arriving before snapshot', self.channel, data)
-                    return None, None
-                tick = self.ticks[c].copy()
-
-                tick.time = tm.datetime
-                tick.exchange_time = et.datetime
-                tick.price = data['l']
-                tick.volume = data['v']
-                tick.amount = data['vc']
-                bids = {p: v for p, v in data['b']}
-                old_bids = {item['price']: item['volume'] for item in tick.bids}
-                old_bids.update(bids)
-                bids = [{'price': p, 'volume': v} for p, v in old_bids.items() if v > 0]
-                bids = sorted(bids, key=lambda x: x['price'], reverse=True)
-
-                asks = {p: v for p, v in data['a']}
-                old_asks = {item['price']: item['volume'] for item in tick.asks}
-                old_asks.update(asks)
-                asks = [{'price': p, 'volume': v} for p, v in old_asks.items() if v > 0]
-                asks = sorted(asks, key=lambda x: x['price'])
-
-                tick.bids = bids
-                tick.asks = asks
-                self.ticks[c] = tick
-                return q_key, tick
+                book = self.books.get(c)
+                if book is None:
+                    self.integrity[c]['discarded' if c in self.stale else 'early'] += 1
+                    if c not in self.stale:
+                        log.warning('update arriving before snapshot', self.channel, c)
+                    return None, SKIPPED
+                if seq is not None and self.seqs.get(c) is not None and seq != self.seqs[c] + 1:
+                    return self.invalidate(c, 'gap', f'seq {self.seqs[c]} -> {seq}')
+                book.update(data['b'], data['a'])
+                error = self.check_book(book, data)
+                if error:
+                    return self.invalidate(c, error)
+            else:
+                return None, None
+            self.seqs[c] = seq
+            tm = parse_time(data['tm'], self.raw_time)
+            et = parse_time(data['et'], self.raw_time) if 'et' in data else None
+            tick = Tick.from_book(tm, data['l'], data['v'], book, c, 'tick.v3', et, data['vc'])
+            self.ticks[c] = tick
+            if self.cache_last_tick:
+                last_ticks.update(tick)
+            return q_key, tick
         except Exception as e:
             log.warning('parse error', e, data)
         return None, None
 
-    async def subscribe_tick_v3(self, contract, on_update):
-        await self.subscribe_data(self.channel, on_update=on_update, contract=contract)
+    def check_book(self, book, data):
+        """
+        :return: name of the failed check or None
+        """
+        if self.check_crossed:
+            bid = book.bids.top()
+            ask = book.asks.top()
+            if bid and ask and bid[0] >= ask[0]:
+                return 'crossed'
+        if self.checksum is not None and 'cs' in data and not self.checksum(book, data['cs']):
+            return 'checksum'
+        return None
+
+    def invalidate(self, contract, reason, detail=''):
+        """
+        drop the book of one contract and resubscribe it for a new snapshot, other contracts are untouched
+        """
+        log.warning('book invalid, resnapshot', contract, reason, detail)
+        self.integrity[contract][reason] += 1
+        self.books.pop(contract, None)
+        self.seqs.pop(contract, None)
+        if contract not in self.stale:
+            self.stale[contract] = asyncio.Event()
+            if not self.offline:
+                self.task_list.append(asyncio.ensure_future(self.resnapshot(contract)))
+        return None, SKIPPED
+
+    async def resnapshot(self, contract):
+        """
+        resubscribe until a snapshot arrives, after resnapshot_retries attempts the websocket is closed so
+        ensure_connected reconnects and recovers every subscription
+        """
+        event = self.stale.get(contract)
+        sub_data = self.sub_params.get((contract, self.channel))
+        if event is None or sub_data is None:
+            return
+        timeout = self.resnapshot_timeout
+        attempts = 0
+        while self.stale.get(contract) is event:
+            try:
+                if attempts < self.resnapshot_retries:
+                    attempts += 1
+                    self.integrity[contract]['resnapshot'] += 1
+                    if self.connected and self.ws is not None and not self.ws.closed:
+                        await self.ws.send_json(sub_data)
+                else:
+                    attempts = 0
+                    self.integrity[contract]['reconnect'] += 1
+                    log.warning('resnapshot retries exhausted, reconnect', contract)
+                    if self.ws is not None and not self.ws.closed:
+                        await self.ws.close()
+                await asyncio.wait_for(event.wait(), timeout)
+                return
+            except asyncio.TimeoutError:
+                log.warning('resnapshot timeout', contract, timeout)
+                timeout = min(timeout * 2, 64)
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                log.warning('resnapshot failed', contract, e)
+                await asyncio.sleep(timeout)
+
+    def on_reconnect(self):
+        # sequence numbers and books of the previous connection do not continue on the new one
+        self.books.clear()
+        self.seqs.clear()
+        stale, self.stale = self.stale, {}
+        for event in stale.values():
+            event.set()
+
+    def integrity_stats(self, contract=None):
+        """
+        :return: {contract: {counter: count}}
+        """
+        if contract is not None:
+            return {contract: dict(self.integrity.get(contract, {}))}
+        return {c: dict(counters) for c, counters in self.integrity.items()}
+
+    async def subscribe_tick_v3(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.subscribe_data(self.channel, on_update=on_update, delivery=delivery, maxsize=maxsize,
+                                  contract=contract)
 
 
 class CandleQuote(Quote):
-    def __init__(self, key):
-        super().__init__(key, Config.CANDLE_HOST_WS, self.parse_candle)
+    def __init__(self, key, raw_time=False, connect=True):
+        """
+        :param key:
+        :param raw_time: keep candle time as epoch float instead of arrow
+        :param connect:
+        """
+        super().__init__(key, Config.CANDLE_HOST_WS, self.parse_candle, connect)
         self.channel = 'subscribe-single-candle'
         self.authorized = True
+        self.raw_time = raw_time
 
     def parse_candle(self, data):
         try:
             if 'data' in data:
                 data = data['data']
-            candle = Candle.from_dict(data)
-            q_key = json.dumps({'contract': candle.contract, 'duration': candle.duration, 'uri': self.channel},
-                               sort_keys=True)
+            candle = Candle.from_dict(data, self.raw_time)
+            q_key = candle.contract, self.channel, candle.duration
             return q_key, candle
         except Exception as e:
             log.warning('parse error', e)
         return None, None
 
-    async def subscribe_candle(self, contract, duration, on_update):
-        await self.subscribe_data(self.channel, on_update=on_update, contract=contract, duration=duration)
+    async def subscribe_candle(self, contract, duration, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.subscribe_data(self.channel, on_update=on_update, delivery=delivery, maxsize=maxsize,
+                                  contract=contract, duration=duration)
 
 
 class ZhubiQuote(Quote):
-    def __init__(self, key):
-        super().__init__(key, Config.TICK_HOST_WS, self.parse_zhubi)
+    def __init__(self, key, raw_time=False, connect=True):
+        """
+        :param key:
+        :param raw_time: keep trade times as epoch float instead of datetime
+        :param connect:
+        """
+        super().__init__(key, Config.TICK_HOST_WS, self.parse_zhubi, connect)
         self.channel = 'subscribe-single-zhubi-verbose'
+        self.raw_time = raw_time
 
     def parse_zhubi(self, data):
         try:
-            zhubi = [Zhubi.from_dict(data) for data in data['data']]
-            q_key = json.dumps({'contract': zhubi[0].contract, 'uri': self.channel}, sort_keys=True)
+            zhubi = [Zhubi.from_dict(data, self.raw_time) for data in data['data']]
+            q_key = zhubi[0].contract, self.channel
             return q_key, zhubi
         except Exception as e:
             log.warning('parse error', e)
         return None, None
 
-    async def subscribe_zhubi(self, contract, on_update):
-        await self.subscribe_data(self.channel, on_update=on_update, contract=contract)
+    async def subscribe_zhubi(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.subscribe_data(self.channel, on_update=on_update, delivery=delivery, maxsize=maxsize,
+                                  contract=contract)
+
+
+class QuotePool:
+    """
+    spread subscriptions of one quote type over several connections, each with its own decode loop and reconnect
+    """
+
+    def __init__(self, quote_cls, size=4, key='pool', dispatcher=None, **kwargs):
+        """
+
+        :param quote_cls: TickQuote, TickV3Quote, CandleQuote or ZhubiQuote
+        :param size: number of websocket connections
+        :param key:
+        :param dispatcher: shared by every connection, so its concurrency limit and pools are pool wide. A dispatcher
+            passed in is not shut down by close
+        :param kwargs: passed to each quote, e.g. raw_time
+        """
+        assert size >= 1
+        self.key = key
+        self.dispatcher = dispatcher or Dispatcher()
+        self.owns_dispatcher = dispatcher is None
+        self.quotes = [quote_cls(f'{key}-{i}', **kwargs) for i in range(size)]
+        for q in self.quotes:
+            q.dispatcher = self.dispatcher
+            q.owns_dispatcher = False
+
+    def shard(self, contract) -> Quote:
+        """
+        rendezvous hashing on the contract, stable across processes and only 1/size of the contracts move when
+        the pool is resized
+        """
+        c = contract.encode()
+        idx = max(range(len(self.quotes)), key=lambda i: zlib.crc32(c, i))
+        return self.quotes[idx]
+
+    async def subscribe_tick(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.shard(contract).subscribe_tick(contract, on_update, delivery, maxsize)
+
+    async def subscribe_tick_v3(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.shard(contract).subscribe_tick_v3(contract, on_update, delivery, maxsize)
+
+    async def subscribe_candle(self, contract, duration, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.shard(contract).subscribe_candle(contract, duration, on_update, delivery, maxsize)
+
+    async def subscribe_zhubi(self, contract, on_update, delivery=ALL, maxsize=MAXSIZE):
+        await self.shard(contract).subscribe_zhubi(contract, on_update, delivery, maxsize)
+
+    @property
+    def conflated(self):
+        return sum(q.conflated for q in self.quotes)
+
+    @property
+    def dropped(self):
+        return sum(q.dropped for q in self.quotes)
+
+    def delivery_stats(self):
+        stats = {}
+        for q in self.quotes:
+            stats.update(q.delivery_stats())
+        return stats
+
+    def enable_latency(self, enable=True):
+        for q in self.quotes:
+            q.enable_latency(enable)
+
+    def callback_stats(self, unit=1e3):
+        return self.dispatcher.stats(unit)
+
+    def latency_stats(self, contract=None, channel=None, unit=1e3):
+        stats = {}
+        for q in self.quotes:
+            stats.update(q.latency_stats(contract, channel, unit))
+        return stats
+
+    def integrity_stats(self, contract=None):
+        """
+        tick-v3 book integrity counters of every shard
+        """
+        if contract is not None:
+            return self.shard(contract).integrity_stats(contract)
+        stats = {}
+        for q in self.quotes:
+            stats.update(q.integrity_stats())
+        return stats
+
+    async def close(self):
+        await asyncio.gather(*[q.close() for q in self.quotes])
+        if self.owns_dispatcher:
+            self.dispatcher.close()
+
+
+_quote_pools = {}
+
+
+async def get_pool(quote_cls, size=4, key='defalut'):
+    """
+    :param quote_cls: TickQuote, TickV3Quote, CandleQuote or ZhubiQuote
+    :param size: only used when the pool is created
+    :param key:
+    :return:
+    """
+    pool_key = quote_cls.__name__, key
+    if pool_key not in _quote_pools:
+        _quote_pools[pool_key] = QuotePool(quote_cls, size, f'{quote_cls.__name__}-{key}')
+    return _quote_pools[pool_key]
 
 
 _client_pool = {}
@@ -306,9 +704,9 @@ async def get_client(key='defalut'):
         return c
 
 
-async def subscribe_tick(contract, on_update):
+async def subscribe_tick(contract, on_update, delivery=ALL, maxsize=MAXSIZE):
     c = await get_client()
-    return await c.subscribe_tick(contract, on_update)
+    return await c.subscribe_tick(contract, on_update, delivery, maxsize)
 
 
 _tick_v3_client = None
@@ -321,9 +719,9 @@ async def get_v3_client():
     return _tick_v3_client
 
 
-async def subscribe_tick_v3(contract, on_update):
+async def subscribe_tick_v3(contract, on_update, delivery=ALL, maxsize=MAXSIZE):
     c = await get_v3_client()
-    return await c.subscribe_tick_v3(contract, on_update)
+    return await c.subscribe_tick_v3(contract, on_update, delivery, maxsize)
 
 
 _candle_client_pool = {}
@@ -338,9 +736,9 @@ async def get_candle_client(key='defalut'):
         return c
 
 
-async def subscribe_candle(contract, duration, on_update):
+async def subscribe_candle(contract, duration, on_update, delivery=ALL, maxsize=MAXSIZE):
     c = await get_candle_client()
-    return await c.subscribe_candle(contract, duration, on_update)
+    return await c.subscribe_candle(contract, duration, on_update, delivery, maxsize)
 
 
 _zhubi_quote_pool = {}
@@ -355,21 +753,80 @@ async def get_zhubi_client(key='defalut'):
         return c
 
 
-async def subscribe_zhubi(contract, on_update):
+async def subscribe_zhubi(contract, on_update, delivery=ALL, maxsize=MAXSIZE):
     c = await get_zhubi_client()
-    return await c.subscribe_zhubi(contract, on_update)
+    return await c.subscribe_zhubi(contract, on_update, delivery, maxsize)
 
 
-async def get_last_tick(contract):
+LAST_TICK_MAX_AGE = 1.0
+
+
+def peek(contract, max_age=None):
+    """
+    last tick received by any tick subscription of this process, never awaits
+
+    :param contract:
+    :param max_age: seconds, older ticks are treated as missing
+    :return: Tick or None
+    """
+    return last_ticks.peek(contract, max_age)
+
+
+async def get_last_tick(contract, max_age=LAST_TICK_MAX_AGE):
+    """
+    :param contract:
+    :param max_age: seconds, a cached tick at most this old is returned without a REST call, 0 always asks REST
+    :return: (Tick, err)
+    """
+    if max_age:
+        tick = last_ticks.peek(contract, max_age)
+        if tick is not None:
+            return tick, None
     from . import autil
     sess = autil.get_aiohttp_session()
     res, err = await autil.http_go(sess.get, f'{Config.HOST_REST}/quote/single-tick/{contract}')
     if not err:
         res = Tick.from_dict(res)
+        last_ticks.update(res)
     return res, err
 
 
-async def get_contracts(exchange):
+def iter_last_ticks(contracts, limit=16, max_age=LAST_TICK_MAX_AGE):
+    """
+    get_last_tick of many contracts, at most limit requests in flight
+
+    :return: async iterator of (contract, Tick, err) as they complete
+    """
+    return autil.bounded(lambda c: get_last_tick(c, max_age), contracts, limit)
+
+
+async def get_last_ticks(contracts, limit=16, max_age=LAST_TICK_MAX_AGE):
+    """
+    :return: {contract: (Tick, err)}
+    """
+    return await autil.gather_bounded(lambda c: get_last_tick(c, max_age), contracts, limit)
+
+
+async def get_contracts(exchange, cached=True):
+    """
+    :param exchange:
+    :param cached: answer from contracts.registry while its copy of the exchange is younger than its ttl, otherwise
+        fetch and store it there
+    :return: (list of Contract, err)
+    """
+    if not cached:
+        return await fetch_contracts(exchange)
+    registry = contracts.registry
+    fetched = registry.fetched.get(exchange)
+    if fetched is not None and time.time() - fetched < registry.ttl:
+        return registry.exchange(exchange), None
+    return await registry.fetch(exchange)
+
+
+async def fetch_contracts(exchange):
+    """
+    contracts of an exchange from REST
+    """
     from . import autil
     sess = autil.get_aiohttp_session()
     res, err = await autil.http_go(sess.get, f'{Config.HOST_REST}/basic/contracts?exchange={exchange}')
@@ -382,7 +839,16 @@ async def get_contracts(exchange):
     return res, err
 
 
-async def get_contract(symbol):
+async def get_contract(symbol, cached=True):
+    """
+    :param symbol:
+    :param cached: answer from contracts.registry when it knows the symbol
+    :return: (Contract, err)
+    """
+    if cached:
+        con = contracts.registry.get(symbol)
+        if con is not None:
+            return con, None
     exchange, name = symbol.split('/')
     from . import autil
     sess = autil.get_aiohttp_session()
@@ -391,5 +857,57 @@ async def get_contract(symbol):
         if not res:
             return None, 'contract-not-exist'
         con = Contract.from_dict(res[0])
+        contracts.registry.add(con)
         return con, err
     return res, err
+
+
+BULK_EXCHANGE_THRESHOLD = 3
+
+
+async def iter_contracts_bulk(symbols, limit=8, cached=True):
+    """
+    get_contract of many symbols, exchanges with BULK_EXCHANGE_THRESHOLD or more missing symbols are fetched in one
+    request per exchange (which also fills contracts.registry), the others symbol by symbol
+
+    :return: async iterator of (symbol, Contract, err) as they complete
+    """
+    groups = defaultdict(list)
+    for symbol in dict.fromkeys(symbols):
+        con = contracts.registry.get(symbol) if cached else None
+        if con is not None:
+            yield symbol, con, None
+        else:
+            groups[symbol.split('/')[0]].append(symbol)
+
+    jobs = []
+    for exchange, group in groups.items():
+        if len(group) >= BULK_EXCHANGE_THRESHOLD:
+            jobs.append((exchange, group))
+        else:
+            jobs.extend((None, [symbol]) for symbol in group)
+
+    async def run(job):
+        exchange, group = job
+        if exchange is None:
+            return await get_contract(group[0], cached=False)
+        _, err = await contracts.registry.fetch(exchange)
+        return None, err
+
+    async for (exchange, group), res, err in autil.bounded(run, jobs, limit):
+        if exchange is None:
+            yield group[0], res, err
+            continue
+        for symbol in group:
+            if err:
+                yield symbol, None, err
+            else:
+                con = contracts.registry.get(symbol)
+                yield symbol, con, None if con else 'contract-not-exist'
+
+
+async def get_contracts_bulk(symbols, limit=8, cached=True):
+    """
+    :return: {symbol: (Contract, err)}
+    """
+    return {symbol: (con, err) async for symbol, con, err in iter_contracts_bulk(symbols, limit, cached)}
@@ -67,6 +67,161 @@ async def test_candle_quote():
     assert happen
 
 
+@pytest.mark.asyncio
+async def test_subscribe_drop_oldest_maxsize():
+    q = onetoken.quote.ZhubiQuote('test-maxsize', connect=False)
+    await q.subscribe_zhubi('okef/btc.usd.q', print, delivery=onetoken.quote.DROP_OLDEST, maxsize=5)
+    assert q.data_queue[q.make_q_key(q.channel, contract='okef/btc.usd.q')].maxsize == 5
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_parse_routes_to_subscription_key():
+    q = onetoken.quote.CandleQuote('test-route')
+    await q.close()
+    data = {'contract': 'okef/btc.usd.q', 'duration': '1m', 'time': '2019-01-01T00:00:00+00:00', 'open': 1,
+            'high': 2, 'low': 0.5, 'close': 1.5, 'volume': 10, 'amount': 15}
+    q_key, candle = q.parse_candle({'data': data})
+    assert q_key == q.make_q_key(q.channel, contract='okef/btc.usd.q', duration='1m')
+    assert candle.close == 1.5
+
+
+@pytest.mark.asyncio
+async def test_pool_shards_by_contract():
+    pool = onetoken.quote.QuotePool(onetoken.quote.TickV3Quote, size=4, key='test-pool', connect=False)
+    bigger = onetoken.quote.QuotePool(onetoken.quote.TickV3Quote, size=5, key='test-pool-5', connect=False)
+    await pool.close()
+    await bigger.close()
+    contracts = [f'binance/coin{i}.usdt' for i in range(400)]
+    shards = [pool.quotes.index(pool.shard(c)) for c in contracts]
+    assert shards == [pool.quotes.index(pool.shard(c)) for c in contracts]
+    assert all(shards.count(i) > 50 for i in range(4))
+    # growing the pool only moves contracts to the new shard
+    for c, i in zip(contracts, shards):
+        j = bigger.quotes.index(bigger.shard(c))
+        assert j == i or j == 4
+
+
+@pytest.mark.asyncio
+async def test_pool_dispatcher_closed_by_pool_only():
+    pool = onetoken.quote.QuotePool(onetoken.quote.TickV3Quote, size=2, key='test-pool-close', connect=False)
+    executor = pool.dispatcher.executor(onetoken.dispatch.THREAD)
+    await pool.quotes[0].close()
+    assert pool.dispatcher.executors == {onetoken.dispatch.THREAD: executor}
+    assert executor.submit(int, '1').result() == 1
+    await pool.close()
+    assert not pool.dispatcher.executors
+
+
+class FakeWs:
+    closed = False
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_tick_v3_resnapshot_one_contract():
+    q = onetoken.quote.TickV3Quote('test-resnapshot', connect=False, resnapshot_timeout=1)
+    got = []
+    await q.subscribe_tick_v3('okef/btc.usd.q', got.append)
+    await q.subscribe_tick_v3('okef/eth.usd.q', got.append)
+    q.offline = False
+    q.ws = FakeWs()
+
+    def msg(c, tp, seq, bids, asks):
+        return {'c': c, 'tp': tp, 'seq': seq, 'tm': 1552435200.0, 'l': 100, 'v': 1, 'vc': 1, 'b': bids, 'a': asks}
+
+    for c in ['okef/btc.usd.q', 'okef/eth.usd.q']:
+        q.handle_data(msg(c, 's', 1, [[99, 1]], [[101, 1]]))
+    q.handle_data(msg('okef/btc.usd.q', 'd', 3, [[99.5, 1]], []))
+    q.handle_data(msg('okef/btc.usd.q', 'd', 4, [[99.6, 1]], []))
+    q.handle_data(msg('okef/eth.usd.q', 'd', 2, [[102, 1]], []))
+    await asyncio.sleep(0.01)
+    assert set(q.stale) == {'okef/btc.usd.q', 'okef/eth.usd.q'}
+    assert q.ws.sent == [{'uri': q.channel, 'contract': 'okef/btc.usd.q'},
+                         {'uri': q.channel, 'contract': 'okef/eth.usd.q'}]
+
+    q.handle_data(msg('okef/btc.usd.q', 's', 10, [[99, 2]], [[101, 1]]))
+    q.handle_data(msg('okef/btc.usd.q', 'd', 11, [[99.5, 1]], []))
+    await asyncio.sleep(0.01)
+    assert 'okef/btc.usd.q' not in q.stale
+    assert q.books['okef/btc.usd.q'].bids.top() == (99.5, 1)
+    assert q.integrity_stats() == {'okef/btc.usd.q': {'gap': 1, 'discarded': 1, 'resnapshot': 1, 'recovered': 1},
+                                   'okef/eth.usd.q': {'crossed': 1, 'resnapshot': 1}}
+    assert len(got) == 4
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_tick_v3_resnapshot_falls_back_to_reconnect():
+    q = onetoken.quote.TickV3Quote('test-resnapshot-reconnect', connect=False, resnapshot_timeout=0.01,
+                                   resnapshot_retries=2)
+    await q.subscribe_tick_v3('okef/btc.usd.q', print)
+    q.offline = False
+    q.ws = FakeWs()
+
+    def msg(tp, seq):
+        return {'c': 'okef/btc.usd.q', 'tp': tp, 'seq': seq, 'tm': 1552435200.0, 'l': 100, 'v': 1, 'vc': 1,
+                'b': [[99, 1]], 'a': [[101, 1]]}
+
+    q.handle_data(msg('s', 1))
+    q.handle_data(msg('d', 3))
+    await asyncio.sleep(0.1)
+    assert q.ws.closed and len(q.ws.sent) == 2
+    assert q.integrity['okef/btc.usd.q']['reconnect'] == 1
+    assert 'okef/btc.usd.q' in q.stale
+    q.on_reconnect()
+    assert not q.stale and not q.books and not q.seqs
+    # the first delta of the new connection is not checked against the old seq
+    q.handle_data(msg('s', 50))
+    q.handle_data(msg('d', 51))
+    assert q.seqs['okef/btc.usd.q'] == 51
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_last_tick_cache():
+    q = onetoken.quote.TickV3Quote('test-cache', connect=False)
+    q.handle_data({'c': 'okef/ltc.usd.q', 'tp': 's', 'tm': 1552435200.0, 'l': 50, 'v': 1, 'vc': 1,
+                   'b': [[49, 1]], 'a': [[51, 1]]})
+    # offline quotes, e.g. fed by a replay, stay out of the cache
+    assert onetoken.quote.peek('okef/ltc.usd.q') is None
+    q.cache_last_tick = True
+    q.handle_data({'c': 'okef/ltc.usd.q', 'tp': 's', 'tm': 1552435200.0, 'l': 50, 'v': 1, 'vc': 1,
+                   'b': [[49, 1]], 'a': [[51, 1]]})
+    tick = onetoken.quote.peek('okef/ltc.usd.q')
+    assert tick.bid1 == 49
+    res, err = await onetoken.quote.get_last_tick('okef/ltc.usd.q')
+    assert err is None and res is tick
+    cache = onetoken.quote.last_ticks
+    cache.ticks['okef/ltc.usd.q'] = tick, cache.ticks['okef/ltc.usd.q'][1] - 5
+    assert onetoken.quote.peek('okef/ltc.usd.q', max_age=1) is None
+    assert 4.9 < cache.age('okef/ltc.usd.q') < 6
+    cache.discard('okef/ltc.usd.q')
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_last_tick_cache_raw_time():
+    q = onetoken.quote.TickV3Quote('test-cache-raw', raw_time=True, connect=False)
+    q.cache_last_tick = True
+    q.handle_data({'c': 'okef/etc.usd.q', 'tp': 's', 'tm': 1552435200.5, 'l': 50, 'v': 1, 'vc': 1,
+                   'b': [[49, 1]], 'a': [[51, 1]]})
+    tick = onetoken.quote.peek('okef/etc.usd.q')
+    assert tick.time == arrow.get(1552435200.5).datetime and tick.bid1 == 49
+    res, err = await onetoken.quote.get_last_tick('okef/etc.usd.q')
+    assert err is None and res is tick
+    onetoken.quote.last_ticks.discard('okef/etc.usd.q')
+    await q.close()
+
+
 if __name__ == "__main__":
     asyncio.ensure_future(test_tick_v3_quote())
     # asyncio.ensure_future(test_candle_quote())
@@ -0,0 +1,183 @@
+"""
+client side rate limit of account requests
+
+every account has a token bucket for all its requests and one per endpoint family (orders, cancels, queries, info).
+Requests waiting for a token are served by priority lane, so cancels and risk reducing orders go ahead of new quotes
+and queries. Limits are {family: (requests per second, burst)}, '*' is the account wide bucket:
+
+    ratelimit.EXCHANGE_LIMITS['binance'] = {'*': (20, 40), 'orders': (10, 20), 'cancels': (10, 20)}
+    ratelimit.load_limits('~/.onetoken/ratelimit.yml')     # same mapping per exchange, '*' for any exchange
+
+an account without limits for its exchange is not limited.
+"""
+import asyncio
+import heapq
+import time
+from pathlib import Path
+
+from .latency import Histogram
+
+# priority lanes, lower goes first
+CANCEL = 0
+REDUCE = 1
+ORDER = 2
+QUERY = 3
+LANES = {CANCEL: 'cancel', REDUCE: 'reduce', ORDER: 'order', QUERY: 'query'}
+
+ORDERS = 'orders'
+CANCELS = 'cancels'
+QUERIES = 'queries'
+INFO = 'info'
+ACCOUNT = '*'
+FAMILY_LANES = {ORDERS: ORDER, CANCELS: CANCEL, QUERIES: QUERY, INFO: QUERY}
+
+# exchange -> {family: (rate, burst)}, '*' exchange for the others
+EXCHANGE_LIMITS = {}
+
+
+def load_limits(path_or_dict):
+    """
+    merge per exchange limits from a yaml file or a dict into EXCHANGE_LIMITS
+    """
+    data = path_or_dict
+    if not isinstance(data, dict):
+        import yaml
+        data = yaml.safe_load(Path(path_or_dict).expanduser().read_text())
+    for exchange, limits in data.items():
+        EXCHANGE_LIMITS[exchange] = {family: tuple(limit) for family, limit in limits.items()}
+    return EXCHANGE_LIMITS
+
+
+def limits_for(exchange):
+    return EXCHANGE_LIMITS.get(exchange, EXCHANGE_LIMITS.get('*'))
+
+
+def endpoint_family(method, endpoint):
+    """
+    :param method: upper case http method
+    :param endpoint: /orders
+    """
+    if endpoint.startswith('/orders'):
+        if method == 'DELETE':
+            return CANCELS
+        if method in ('POST', 'PATCH'):
+            return ORDERS
+        return QUERIES
+    if endpoint == '/info':
+        return INFO
+    return QUERIES
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        """
+
+        :param rate: tokens per second
+        :param burst: bucket size, rate by default
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.waiters = []
+        self.seq = 0
+        self.timer = None
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def try_acquire(self):
+        self._refill(time.monotonic())
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, priority=QUERY):
+        """
+        wait for a token, waiters are served by priority then arrival
+        """
+        if self.try_acquire():
+            return
+        fut = asyncio.get_event_loop().create_future()
+        self.seq += 1
+        heapq.heappush(self.waiters, (priority, self.seq, fut))
+        self._schedule()
+        await fut
+
+    def _schedule(self):
+        if self.timer is None and self.waiters:
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            self.timer = asyncio.get_event_loop().call_later(wait, self._release)
+
+    def _release(self):
+        self.timer = None
+        self._refill(time.monotonic())
+        while self.waiters and self.tokens >= 1:
+            _, _, fut = heapq.heappop(self.waiters)
+            if fut.done():
+                # the waiter was cancelled
+                continue
+            self.tokens -= 1
+            fut.set_result(None)
+        # drop cancelled waiters so they do not hold the timer
+        while self.waiters and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+        self._schedule()
+
+    def penalize(self, seconds):
+        """
+        the server said too frequent, no token for about seconds
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, fut in self.waiters if not fut.done())
+
+
+class RateLimiter:
+    def __init__(self, limits):
+        """
+
+        :param limits: {family: (rate, burst)}, '*' for the account wide bucket
+        """
+        self.buckets = {family: TokenBucket(*limit) for family, limit in limits.items()}
+        self.delays = {}
+        self.throttled = 0
+
+    async def acquire(self, family, priority=None):
+        """
+        :return: seconds waited
+        """
+        if priority is None:
+            priority = FAMILY_LANES.get(family, QUERY)
+        start = time.monotonic()
+        bucket = self.buckets.get(family)
+        if bucket is not None:
+            await bucket.acquire(priority)
+        bucket = self.buckets.get(ACCOUNT)
+        if bucket is not None:
+            await bucket.acquire(priority)
+        delay = time.monotonic() - start
+        hist = self.delays.get(priority)
+        if hist is None:
+            hist = self.delays[priority] = Histogram()
+        hist.record(delay)
+        return delay
+
+    def penalize(self, family, seconds=1.0):
+        self.throttled += 1
+        for key in (family, ACCOUNT):
+            if key in self.buckets:
+                self.buckets[key].penalize(seconds)
+
+    def stats(self, unit=1e3):
+        """
+        :return: {'delay': {lane: histogram dict}, 'waiting': {family: count}, 'throttled': count}
+        """
+        return {'delay': {LANES.get(p, p): hist.to_dict(unit) for p, hist in sorted(self.delays.items())},
+                'waiting': {family: bucket.waiting for family, bucket in self.buckets.items()},
+                'throttled': self.throttled}
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from . import ratelimit
+from .ratelimit import RateLimiter, TokenBucket
+
+
+def test_endpoint_family():
+    assert ratelimit.endpoint_family('POST', '/orders') == ratelimit.ORDERS
+    assert ratelimit.endpoint_family('DELETE', '/orders/all') == ratelimit.CANCELS
+    assert ratelimit.endpoint_family('GET', '/orders') == ratelimit.QUERIES
+    assert ratelimit.endpoint_family('GET', '/info') == ratelimit.INFO
+
+
+@pytest.mark.asyncio
+async def test_priority_lanes():
+    limiter = RateLimiter({'*': (100, 1)})
+    served = []
+
+    async def call(name, family, priority=None):
+        await limiter.acquire(family, priority)
+        served.append(name)
+
+    await call('first', ratelimit.QUERIES)
+    tasks = [asyncio.ensure_future(call('query', ratelimit.QUERIES)),
+             asyncio.ensure_future(call('quote', ratelimit.ORDERS)),
+             asyncio.ensure_future(call('reduce', ratelimit.ORDERS, ratelimit.REDUCE)),
+             asyncio.ensure_future(call('cancel', ratelimit.CANCELS))]
+    bg = time.monotonic()
+    await asyncio.gather(*tasks)
+    assert served == ['first', 'cancel', 'reduce', 'quote', 'query']
+    assert time.monotonic() - bg >= 0.035
+    stats = limiter.stats()
+    assert stats['delay']['query']['count'] == 2
+    assert stats['delay']['cancel']['max'] < stats['delay']['query']['max']
+
+
+@pytest.mark.asyncio
+async def test_penalize_and_cancelled_waiter():
+    bucket = TokenBucket(100, 1)
+    assert bucket.try_acquire()
+    waiter = asyncio.ensure_future(bucket.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    bucket.penalize(0.05)
+    bg = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - bg >= 0.05
+    assert bucket.waiting == 0
+
+
+def test_load_limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'EXCHANGE_LIMITS', {})
+    ratelimit.load_limits({'binance': {'*': [20, 40], 'orders': [10, 20]}, '*': {'*': [5, 5]}})
+    assert ratelimit.limits_for('binance')['orders'] == (10, 20)
+    assert ratelimit.limits_for('okex') == {'*': (5, 5)}
@@ -0,0 +1,261 @@
+"""
+columnar recorder for quote messages
+
+every column is an append-only file of little-endian float64 values:
+
+    <root>/<channel>/<exchange>/<name>/<YYYYMMDD>/<column>.f8
+
+so a day of one contract can be memory mapped with numpy.memmap(path, dtype='<f8') or loaded with read_day.
+Rows are batched on the event loop and written, rotated by UTC day, and flushed from a background thread.
+"""
+import asyncio
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .logger import log
+from .model import Tick, Candle, Zhubi
+from .timeparse import parse_epoch
+
+NAN = float('nan')
+
+
+def tick_columns(depth):
+    cols = ['time', 'exchange_time', 'price', 'volume', 'amount']
+    for side in ['bid', 'ask']:
+        for i in range(depth):
+            cols.extend([f'{side}{i + 1}_price', f'{side}{i + 1}_volume'])
+    return cols
+
+
+CANDLE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
+ZHUBI_COLUMNS = ['time', 'exchange_time', 'price', 'amount', 'bs']
+
+
+def _epoch(tm):
+    return NAN if tm is None else parse_epoch(tm)
+
+
+def _num(value):
+    return NAN if value is None else float(value)
+
+
+class Recorder:
+    def __init__(self, root, depth=5, batch_size=1000, flush_interval=1.0):
+        """
+
+        :param root: directory of the recorded files
+        :param depth: book levels per side kept for ticks
+        :param batch_size: rows buffered on the event loop before handing them to the writer thread
+        :param flush_interval: seconds, buffered rows are handed over and files flushed at least this often
+        """
+        self.root = Path(root).expanduser()
+        self.depth = depth
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.columns = {'tick': tick_columns(depth), 'tick-v3': tick_columns(depth),
+                        'candle': CANDLE_COLUMNS, 'zhubi': ZHUBI_COLUMNS}
+        self.pending = {}
+        self.pending_rows = 0
+        self.rows = 0
+        # counted from the event loop and the writer thread
+        self.errors = 0
+        self.errors_lock = threading.Lock()
+        self.quotes = []
+        self.flush_task = None
+        self.write_q = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name='ot-recorder', daemon=True)
+        self.writer.start()
+
+    def attach(self, quote):
+        quote.taps.append(self.on_data)
+        self.quotes.append(quote)
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_loop())
+
+    def detach(self, quote):
+        if self.on_data in quote.taps:
+            quote.taps.remove(self.on_data)
+        if quote in self.quotes:
+            self.quotes.remove(quote)
+
+    def on_data(self, q_key, data):
+        try:
+            if isinstance(data, Tick):
+                channel = 'tick-v3' if data.source == 'tick.v3' else 'tick'
+                self._append(channel, data.contract, self.tick_row(data))
+            elif isinstance(data, Candle):
+                self._append('candle', f'{data.contract}/{data.duration}', self.candle_row(data))
+            elif isinstance(data, list) and data and isinstance(data[0], Zhubi):
+                for zhubi in data:
+                    self._append('zhubi', zhubi.contract, self.zhubi_row(zhubi))
+        except Exception:
+            self.count_error()
+            log.exception('record failed', q_key)
+
+    def count_error(self):
+        with self.errors_lock:
+            self.errors += 1
+
+    def tick_row(self, tick):
+        row = [_epoch(tick.time), _epoch(tick.exchange_time), _num(tick.price), _num(tick.volume),
+               _num(tick.amount)]
+        for bs in ['b', 's']:
+            levels = tick.levels(bs, self.depth)
+            for p, v in levels:
+                row.append(p)
+                row.append(v)
+            row.extend([NAN] * (2 * (self.depth - len(levels))))
+        return row
+
+    @staticmethod
+    def candle_row(candle):
+        return [_epoch(candle.time), _num(candle.open), _num(candle.high), _num(candle.low), _num(candle.close),
+                _num(candle.volume), _num(candle.amount)]
+
+    @staticmethod
+    def zhubi_row(zhubi):
+        return [_epoch(zhubi.time), _epoch(zhubi.exchange_time), _num(zhubi.price), _num(zhubi.amount),
+                1.0 if zhubi.bs == 'b' else -1.0]
+
+    def _append(self, channel, contract, row):
+        key = channel, contract
+        if key not in self.pending:
+            self.pending[key] = []
+        self.pending[key].append(row)
+        self.pending_rows += 1
+        if self.pending_rows >= self.batch_size:
+            self.submit()
+
+    def submit(self):
+        """
+        hand buffered rows to the writer thread, never blocks
+        """
+        if not self.pending:
+            return
+        self.write_q.put_nowait(self.pending)
+        self.rows += self.pending_rows
+        self.pending = {}
+        self.pending_rows = 0
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.submit()
+
+    def close(self, timeout=10):
+        """
+        write everything buffered and stop the writer thread
+        """
+        for quote in list(self.quotes):
+            self.detach(quote)
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.submit()
+        self.write_q.put(None)
+        self.writer.join(timeout)
+
+    def _write_loop(self):
+        files = {}
+        days = {}
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = self.write_q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                batch = {}
+            if batch is None:
+                break
+            try:
+                for (channel, contract), rows in batch.items():
+                    self._write_rows(files, days, channel, contract, rows)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    for fh in files.values():
+                        fh.flush()
+                    last_flush = time.monotonic()
+            except Exception:
+                self.count_error()
+                log.exception('recorder write failed')
+        for fh in files.values():
+            fh.close()
+
+    def _write_rows(self, files, days, channel, contract, rows):
+        columns = self.columns[channel]
+        by_day = {}
+        for row in rows:
+            tm = row[0]
+            day = datetime.fromtimestamp(tm, timezone.utc).strftime('%Y%m%d') if not math.isnan(tm) else 'unknown'
+            by_day.setdefault(day, []).append(row)
+        for day, day_rows in sorted(by_day.items()):
+            key = channel, contract
+            if days.get(key) != day:
+                # rotate, files of the previous day are closed
+                for col in columns:
+                    fh = files.pop((channel, contract, col), None)
+                    if fh:
+                        fh.close()
+                days[key] = day
+            folder = self.root / channel / contract / day
+            values = [array('d', [row[idx] for row in day_rows]) for idx in range(len(columns))]
+            starts = {}
+            try:
+                for col, col_values in zip(columns, values):
+                    fh = files.get((channel, contract, col))
+                    if fh is None:
+                        folder.mkdir(parents=True, exist_ok=True)
+                        fh = open(folder / f'{col}.f8', 'ab')
+                        files[(channel, contract, col)] = fh
+                    starts[col] = fh.tell()
+                    if sys.byteorder != 'little':
+                        col_values.byteswap()
+                    col_values.tofile(fh)
+            except Exception:
+                # the rows are written to every column or to none, so the columns stay aligned row by row
+                for col, start in starts.items():
+                    self._truncate(files.pop((channel, contract, col)), folder / f'{col}.f8', start)
+                raise
+
+    @staticmethod
+    def _truncate(fh, path, size):
+        try:
+            fh.close()
+        except Exception:
+            pass
+        try:
+            os.truncate(path, size)
+        except Exception:
+            log.exception('recorder truncate failed', path)
+
+
+def read_day(root, channel, contract, day):
+    """
+    :param root:
+    :param channel: tick, tick-v3, candle or zhubi
+    :param contract: okef/btc.usd.q, candles also carry the duration okef/btc.usd.q/1m
+    :param day: YYYYMMDD
+    :return: {column: numpy memmap}, or {column: array('d')} if numpy is not installed
+    """
+    folder = Path(root).expanduser() / channel / contract / day
+    result = {}
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    for path in sorted(folder.glob('*.f8')):
+        if numpy is not None:
+            result[path.stem] = numpy.memmap(path, dtype='<f8', mode='r') if path.stat().st_size else \
+                numpy.zeros(0)
+        else:
+            values = array('d')
+            values.frombytes(path.read_bytes())
+            if sys.byteorder != 'little':
+                values.byteswap()
+            result[path.stem] = values
+    return result
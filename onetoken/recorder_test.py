@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+from .model import Tick, Candle, Zhubi
+from .orderbook import OrderBook
+from .recorder import Recorder, read_day
+
+
+def test_record_and_read(tmp_path):
+    rec = Recorder(tmp_path, depth=2, batch_size=2)
+    t0 = datetime(2019, 3, 13, 23, 59, 59, tzinfo=timezone.utc)
+    t1 = datetime(2019, 3, 14, 0, 0, 1, tzinfo=timezone.utc)
+    book = OrderBook([[10, 1], [9, 2], [8, 3]], [[11, 4]])
+    for tm in [t0, t1]:
+        tick = Tick.from_book(tm, 10.5, 100, book, 'okef/btc.usd.q', 'tick.v3', tm, 7)
+        rec.on_data(('okef/btc.usd.q', 'subscribe-single-tick-verbose'), tick)
+    rec.on_data(None, Candle(t0, 1, 2, 0.5, 1.5, 10, 'okef/btc.usd.q', '1m', 15))
+    rec.on_data(None, [Zhubi(t0, t0, 'okef/btc.usd.q', 10, 1, 'b'), Zhubi(t0, t0, 'okef/btc.usd.q', 11, 2, 's')])
+    rec.close()
+    assert rec.errors == 0
+
+    day0 = read_day(tmp_path, 'tick-v3', 'okef/btc.usd.q', '20190313')
+    day1 = read_day(tmp_path, 'tick-v3', 'okef/btc.usd.q', '20190314')
+    assert list(day0['time']) == [t0.timestamp()]
+    assert list(day1['time']) == [t1.timestamp()]
+    assert list(day1['bid2_price']) == [9]
+    assert list(day1['ask1_volume']) == [4]
+    assert str(day1['ask2_price'][0]) == 'nan'
+
+    candle = read_day(tmp_path, 'candle', 'okef/btc.usd.q/1m', '20190313')
+    assert list(candle['close']) == [1.5]
+    zhubi = read_day(tmp_path, 'zhubi', 'okef/btc.usd.q', '20190313')
+    assert list(zhubi['bs']) == [1, -1]
+    assert list(zhubi['amount']) == [1, 2]
+
+
+def test_failed_write_keeps_columns_aligned(tmp_path):
+    t0 = datetime(2019, 3, 13, 8, 0, 0, tzinfo=timezone.utc)
+    book = OrderBook([[10, 1]], [[11, 4]])
+    folder = tmp_path / 'tick-v3' / 'okef/btc.usd.q' / '20190313'
+    (folder / 'price.f8').mkdir(parents=True)
+    for rows in [1, 2]:
+        rec = Recorder(tmp_path, depth=1)
+        for _ in range(rows):
+            rec.on_data(None, Tick.from_book(t0, 10.5, 100, book, 'okef/btc.usd.q', 'tick.v3', t0, 7))
+        rec.close()
+        if rows == 1:
+            # price.f8 cannot be opened, the columns written before it are rolled back
+            assert rec.errors == 1
+            assert (folder / 'time.f8').stat().st_size == 0
+            (folder / 'price.f8').rmdir()
+    assert rec.errors == 0
+    day = read_day(tmp_path, 'tick-v3', 'okef/btc.usd.q', '20190313')
+    assert {len(values) for values in day.values()} == {2}
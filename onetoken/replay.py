@@ -0,0 +1,248 @@
+"""
+record raw quote messages and replay them through the Quote parse / dispatch path
+
+frames are stored as json lines {"t": <receive epoch>, "m": <decoded message>}, one file per quote type.
+
+    rec = FrameRecorder('~/data/tick-v3-20190313.jsonl')
+    rec.attach(await quote.get_v3_client())
+
+    # in-process, no network
+    q = TickV3Quote(connect=False)
+    await q.subscribe_tick_v3('okef/btc.usd.q', on_update)
+    await Replay('~/data/tick-v3-20190313.jsonl', speed=10).inject(q)
+
+    # over a local websocket server speaking the quote protocol
+    server = QuoteServer()
+    await server.start()
+    Config.TICK_V3_HOST_WS = server.url
+    ...
+    await Replay(path, speed=None).serve(server)
+"""
+import asyncio
+import gzip
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from . import codec
+from .logger import log
+
+
+class FrameRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        """
+
+        :param path: json lines file, appended
+        :param flush_interval: seconds between flushes of the writer thread
+        """
+        self.path = Path(path).expanduser()
+        self.flush_interval = flush_interval
+        self.frames = 0
+        self.quotes = []
+        self.write_q = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name='ot-frame-recorder', daemon=True)
+        self.writer.start()
+
+    def attach(self, quote):
+        quote.raw_taps.append(self.on_frame)
+        self.quotes.append(quote)
+
+    def detach(self, quote):
+        if self.on_frame in quote.raw_taps:
+            quote.raw_taps.remove(self.on_frame)
+        if quote in self.quotes:
+            self.quotes.remove(quote)
+
+    def on_frame(self, data):
+        self.write_q.put_nowait((time.time(), data))
+        self.frames += 1
+
+    def close(self, timeout=10):
+        for quote in list(self.quotes):
+            self.detach(quote)
+        self.write_q.put(None)
+        self.writer.join(timeout)
+
+    def _write_loop(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    item = self.write_q.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if item:
+                    t, data = item
+                    f.write(codec.dumps({'t': t, 'm': data}))
+                    f.write('\n')
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+
+
+def read_frames(path):
+    """
+    :return: iterator of (receive epoch, message)
+    """
+    with open(Path(path).expanduser()) as f:
+        for line in f:
+            if line.strip():
+                item = codec.loads(line)
+                yield item['t'], item['m']
+
+
+def message_contract(data):
+    """
+    contract (and duration for candles) a data message belongs to
+    """
+    if 'c' in data:
+        return data['c'], None
+    body = data.get('data', data)
+    if isinstance(body, list):
+        body = body[0] if body else {}
+    return body.get('contract'), body.get('duration')
+
+
+class QuoteServer:
+    """
+    local stand-in of the quote websocket: answers auth / ping / subscribe and pushes gzip frames to the clients
+    subscribed to their contract
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.clients = {}
+        self.runner = None
+        self.subscribed = asyncio.Event()
+        self.sent = 0
+
+    @property
+    def url(self):
+        return f'ws://{self.host}:{self.port}/'
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/', self.handle_ws)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = self.runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        for ws in list(self.clients):
+            await ws.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.clients[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                uri = data.get('uri')
+                if uri == 'auth':
+                    await ws.send_json({'uri': 'auth', 'code': 'ok'})
+                elif uri == 'ping':
+                    await ws.send_json({'uri': 'pong'})
+                elif uri and uri.startswith('subscribe'):
+                    self.clients[ws].add((data.get('contract'), data.get('duration')))
+                    await ws.send_json({'uri': uri, 'code': 'ok', 'contract': data.get('contract')})
+                    self.subscribed.set()
+                    self.on_subscribe(ws, data)
+        finally:
+            self.clients.pop(ws, None)
+        return ws
+
+    def on_subscribe(self, ws, data):
+        """
+        hook for servers that answer a subscription with a snapshot
+        """
+
+    def is_subscribed(self, ws, contract, duration=None):
+        subs = self.clients.get(ws, ())
+        return (contract, duration) in subs or (contract, None) in subs
+
+    async def broadcast(self, data, frame=None):
+        """
+        :param data: decoded message
+        :param frame: pre-encoded gzip frame of data
+        """
+        contract, duration = message_contract(data)
+        if frame is None:
+            frame = gzip.compress(codec.dumps(data).encode())
+        for ws in list(self.clients):
+            if self.is_subscribed(ws, contract, duration) and not ws.closed:
+                await ws.send_bytes(frame)
+                self.sent += 1
+
+
+class Replay:
+    def __init__(self, frames, speed=1.0):
+        """
+
+        :param frames: path of a FrameRecorder file, or iterable of (epoch, message)
+        :param speed: 1 -> real time, N -> N times faster, None or 0 -> as fast as possible
+        """
+        if isinstance(frames, (str, Path)):
+            frames = read_frames(frames)
+        self.frames = frames
+        self.speed = speed
+        self.count = 0
+
+    async def _paced(self):
+        t0 = None
+        start = time.monotonic()
+        for t, data in self.frames:
+            if self.speed:
+                if t0 is None:
+                    t0 = t
+                delay = (t - t0) / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield data
+
+    async def inject(self, quote, yield_every=100):
+        """
+        feed messages straight into quote.handle_data, the quote can be created with connect=False
+
+        :param quote:
+        :param yield_every: messages between yields to the event loop when replaying as fast as possible
+        """
+        async for data in self._paced():
+            try:
+                quote.handle_data(data)
+            except Exception:
+                log.exception('replay message failed', data)
+            self.count += 1
+            if not self.speed and self.count % yield_every == 0:
+                await asyncio.sleep(0)
+        # let handlers drain what was queued
+        await asyncio.sleep(0)
+        return self.count
+
+    async def serve(self, server, wait_subscribe=True):
+        """
+        push messages to the clients of a started QuoteServer
+        """
+        if wait_subscribe:
+            await server.subscribed.wait()
+        async for data in self._paced():
+            await server.broadcast(data)
+            self.count += 1
+        return self.count
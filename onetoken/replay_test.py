@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from .quote import TickV3Quote
+from .replay import FrameRecorder, Replay, QuoteServer
+
+
+def frames(contract='okef/btc.usd.q'):
+    yield 1552440686.0, {'c': contract, 'tp': 's', 'tm': 1552440686.0, 'et': 1552440686.0, 'l': 10, 'v': 1,
+                         'vc': 1, 'b': [[10, 1], [9, 1]], 'a': [[11, 1], [12, 1]]}
+    for i in range(1, 20):
+        yield 1552440686.0 + i * 0.01, {'c': contract, 'tp': 'd', 'tm': 1552440686.0 + i * 0.01,
+                                        'et': 1552440686.0, 'l': 10, 'v': 1 + i, 'vc': 1,
+                                        'b': [[10, 1 + i]], 'a': []}
+
+
+@pytest.mark.asyncio
+async def test_inject_and_record(tmp_path):
+    q = TickV3Quote('test-replay', connect=False)
+    rec = FrameRecorder(tmp_path / 'frames.jsonl')
+    rec.attach(q)
+    got = []
+    await q.subscribe_tick_v3('okef/btc.usd.q', lambda tk: got.append(tk))
+    assert await Replay(frames(), speed=None).inject(q) == 20
+    await asyncio.sleep(0.01)
+    rec.close()
+    await q.close()
+    assert [tk.volume for tk in got] == list(range(1, 21))
+    assert got[-1].bids[0] == {'price': 10, 'volume': 20}
+
+    # the recorded file replays the same way at 100x speed
+    q2 = TickV3Quote('test-replay-2', connect=False)
+    got2 = []
+    await q2.subscribe_tick_v3('okef/btc.usd.q', lambda tk: got2.append(tk))
+    await Replay(tmp_path / 'frames.jsonl', speed=100).inject(q2)
+    await asyncio.sleep(0.01)
+    await q2.close()
+    assert [tk.volume for tk in got2] == list(range(1, 21))
+
+
+@pytest.mark.asyncio
+async def test_serve_over_websocket():
+    server = await QuoteServer().start()
+    q = TickV3Quote('test-replay-ws')
+    q.ws_url = server.url
+    got = []
+    await asyncio.wait_for(q.subscribe_tick_v3('okef/btc.usd.q', lambda tk: got.append(tk)), 10)
+    await asyncio.wait_for(Replay(frames(), speed=None).serve(server), 10)
+    for _ in range(50):
+        if len(got) == 20:
+            break
+        await asyncio.sleep(0.05)
+    await q.close()
+    await server.close()
+    assert [tk.volume for tk in got] == list(range(1, 21))
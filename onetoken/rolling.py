@@ -0,0 +1,209 @@
+"""
+fixed size numpy ring buffers of tick derived fields, per contract
+
+    rolling = Rolling(capacity=4096)
+    rolling.attach(await quote.get_v3_client())
+    await quote.subscribe_tick_v3('okef/btc.usd.q', on_update)
+
+    ring = rolling['okef/btc.usd.q']
+    ring.mean('mid', seconds=60)
+    ring.ewma('spread', span=100)
+    ring.returns('wmid', n=500)
+
+every value is written twice, at i and i + capacity, so the latest n rows are always a contiguous view and windows
+are never copied. Memory per contract is capacity * 2 * len(FIELDS) * 8 bytes. numpy is only needed by this module.
+"""
+from .logger import log
+from .model import Tick
+from .timeparse import parse_epoch
+
+FIELDS = ['time', 'price', 'mid', 'wmid', 'spread', 'imbalance', 'dvolume', 'damount']
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required by onetoken.rolling, pip install numpy')
+    return numpy
+
+
+class TickRing:
+    def __init__(self, capacity=1024, depth=1):
+        """
+
+        :param capacity: rows kept
+        :param depth: book levels summed on each side for the imbalance
+        """
+        np = _numpy()
+        self.np = np
+        self.capacity = capacity
+        self.depth = depth
+        self.data = np.full((len(FIELDS), 2 * capacity), np.nan)
+        self.index = {name: i for i, name in enumerate(FIELDS)}
+        self.pos = 0
+        self.count = 0
+        self.last_volume = None
+        self.last_amount = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def row(self, tick):
+        bid = tick.levels('b', self.depth)
+        ask = tick.levels('s', self.depth)
+        if bid and ask:
+            bp, bv = bid[0]
+            ap, av = ask[0]
+            mid = (bp + ap) / 2
+            wmid = (bp * av + ap * bv) / (av + bv) if av + bv else mid
+            spread = ap - bp
+            bsum = sum(v for _, v in bid)
+            asum = sum(v for _, v in ask)
+            imbalance = (bsum - asum) / (bsum + asum) if bsum + asum else 0.0
+        else:
+            mid = wmid = spread = imbalance = float('nan')
+
+        dvolume = damount = 0.0
+        if tick.volume is not None:
+            if self.last_volume is not None and tick.volume >= self.last_volume:
+                dvolume = tick.volume - self.last_volume
+            self.last_volume = tick.volume
+        if tick.amount is not None:
+            if self.last_amount is not None and tick.amount >= self.last_amount:
+                damount = tick.amount - self.last_amount
+            self.last_amount = tick.amount
+        elif dvolume:
+            damount = dvolume * tick.price
+        return parse_epoch(tick.time), tick.price, mid, wmid, spread, imbalance, dvolume, damount
+
+    def append(self, tick):
+        row = self.row(tick)
+        i = self.pos
+        self.data[:, i] = row
+        self.data[:, i + self.capacity] = row
+        self.pos = (i + 1) % self.capacity
+        self.count += 1
+
+    def _bounds(self, n=None, seconds=None):
+        size = len(self)
+        end = self.pos + self.capacity
+        start = end - size
+        if n is not None:
+            start = max(start, end - n)
+        if seconds is not None and size:
+            times = self.data[0, start:end]
+            start += int(self.np.searchsorted(times, times[-1] - seconds, side='right'))
+        return start, end
+
+    def column(self, field, n=None, seconds=None):
+        """
+        view of a field in time order, oldest first, not a copy
+
+        :param field: one of FIELDS
+        :param n: last n rows
+        :param seconds: rows newer than the last row minus seconds
+        """
+        start, end = self._bounds(n, seconds)
+        return self.data[self.index[field], start:end]
+
+    def last(self, field):
+        if not self.count:
+            return None
+        return float(self.data[self.index[field], self.pos + self.capacity - 1])
+
+    def mean(self, field, n=None, seconds=None):
+        values = self.column(field, n, seconds)
+        return float(self.np.nanmean(values)) if len(values) else None
+
+    def std(self, field, n=None, seconds=None, ddof=0):
+        values = self.column(field, n, seconds)
+        return float(self.np.nanstd(values, ddof=ddof)) if len(values) else None
+
+    def ewma(self, field, span=None, alpha=None, n=None, seconds=None):
+        """
+        exponentially weighted mean of the window, newest row has weight 1
+
+        :param span: alpha = 2 / (span + 1)
+        :param alpha:
+        """
+        if alpha is None:
+            alpha = 2.0 / (span + 1)
+        values = self.column(field, n, seconds)
+        if not len(values):
+            return None
+        np = self.np
+        weights = (1 - alpha) ** np.arange(len(values) - 1, -1, -1)
+        mask = ~np.isnan(values)
+        return float(np.dot(weights[mask], values[mask]) / weights[mask].sum())
+
+    def returns(self, field='mid', n=None, seconds=None, log_return=False):
+        """
+        :return: array of row over row returns of the window
+        """
+        values = self.column(field, n, seconds)
+        np = self.np
+        if log_return:
+            return np.diff(np.log(values))
+        return values[1:] / values[:-1] - 1
+
+    def vwap(self, n=None, seconds=None):
+        """
+        traded amount over traded volume in the window, from the cumulative tick volume / amount
+        """
+        volume = self.column('dvolume', n, seconds).sum()
+        if not volume:
+            return None
+        return float(self.column('damount', n, seconds).sum() / volume)
+
+
+class Rolling:
+    def __init__(self, capacity=1024, depth=1):
+        """
+
+        :param capacity: rows kept per contract
+        :param depth: book levels summed on each side for the imbalance
+        """
+        _numpy()
+        self.capacity = capacity
+        self.depth = depth
+        self.rings = {}
+        self.quotes = []
+
+    def __getitem__(self, contract):
+        return self.rings[contract]
+
+    def __contains__(self, contract):
+        return contract in self.rings
+
+    def get(self, contract):
+        ring = self.rings.get(contract)
+        if ring is None:
+            ring = self.rings[contract] = TickRing(self.capacity, self.depth)
+        return ring
+
+    def on_tick(self, tick):
+        """
+        on_update handler for subscribe_tick / subscribe_tick_v3
+        """
+        try:
+            self.get(tick.contract).append(tick)
+        except Exception:
+            log.exception('rolling append failed', tick.contract)
+
+    def on_data(self, q_key, data):
+        if isinstance(data, Tick):
+            self.on_tick(data)
+
+    def attach(self, quote):
+        """
+        feed every tick of the quote connection
+        """
+        quote.taps.append(self.on_data)
+        self.quotes.append(quote)
+
+    def detach(self, quote):
+        if self.on_data in quote.taps:
+            quote.taps.remove(self.on_data)
+        if quote in self.quotes:
+            self.quotes.remove(quote)
@@ -0,0 +1,40 @@
+import pytest
+
+from .model import Tick
+
+np = pytest.importorskip('numpy')
+
+from .rolling import Rolling  # noqa: E402
+
+
+def tick(t, bid, ask, volume, amount=None, bid_volume=1, ask_volume=1):
+    return Tick(float(t), (bid + ask) / 2, volume, bids=[{'price': bid, 'volume': bid_volume}],
+                asks=[{'price': ask, 'volume': ask_volume}], contract='okef/btc.usd.q', amount=amount)
+
+
+def test_ring_wraps_and_windows():
+    rolling = Rolling(capacity=4)
+    for i in range(6):
+        rolling.on_tick(tick(i, 100 + i, 102 + i, 10 * i, bid_volume=3))
+    ring = rolling['okef/btc.usd.q']
+    assert len(ring) == 4
+    assert list(ring.column('time')) == [2, 3, 4, 5]
+    assert list(ring.column('mid', n=2)) == [105, 106]
+    assert list(ring.column('time', seconds=1.5)) == [4, 5]
+    assert ring.last('spread') == 2
+    assert ring.last('imbalance') == 0.5
+    assert ring.last('wmid') == pytest.approx((105 * 1 + 107 * 3) / 4)
+    assert ring.mean('mid') == 104.5
+    assert ring.std('mid') == pytest.approx(np.std([103, 104, 105, 106]))
+    assert list(ring.returns('mid', n=2)) == pytest.approx([106 / 105 - 1])
+    assert ring.ewma('mid', alpha=1) == 106
+    assert ring.ewma('mid', alpha=0.5) == pytest.approx((106 + 105 / 2 + 104 / 4 + 103 / 8) / (1 + 1 / 2 + 1 / 4 + 1 / 8))
+
+
+def test_vwap_from_cumulative_volume():
+    rolling = Rolling(capacity=8)
+    rolling.on_tick(tick(0, 99, 101, 100, amount=10000))
+    rolling.on_tick(tick(1, 99, 101, 110, amount=11010))
+    rolling.on_tick(tick(2, 99, 101, 130, amount=13050))
+    assert rolling['okef/btc.usd.q'].vwap() == pytest.approx(3050 / 30)
+    assert rolling['okef/btc.usd.q'].vwap(n=1) == pytest.approx(102)
@@ -27,3 +27,16 @@ def test_ws_sign():
                          data_str=None)
     print(r)
     assert r == 'e5eadcb5d34e7d05465015ba35fd96b0424fdcfedd1fde2313cf9434d23c4c67'
+
+
+def test_signer_matches_gen_sign():
+    signer = account.Signer('this-is-long-secret', 'this-is-key', '/okex/demo')
+    assert signer.sign('GET', '/info', 'this-is-nonce') == \
+        'bf676b208d1b90e2763b0206f8426fc66583b07281a0368c97a9ee71e098e33e'
+    assert signer.sign('POST', '/info', 'this-is-nonce', b'{"price": 0.1,     "amount": 0.2}') == \
+        'd75535f8f5e2d21dd5e5a0e8609ef56e3177d55f661dfc51b458b9d7ada711dc'
+    body = '{"contract": "okex/btc.usdt", "price": 1}'
+    assert signer.sign('POST', '/orders?x=1', '123', body.encode()) == \
+        account.gen_sign('this-is-long-secret', 'POST', '/okex/demo/orders?x=1', '123', body)
+    headers = signer.headers('DELETE', '/orders')
+    assert headers['Api-Signature'] == signer.sign('DELETE', '/orders', headers['Api-Nonce'])
@@ -0,0 +1,72 @@
+"""
+process wide cache of the last tick of every contract
+
+TickQuote and TickV3Quote put every parsed tick here, except offline quotes (see Quote.cache_last_tick).
+quote.get_last_tick answers from it when the tick is fresh and quote.peek reads it without awaiting. Age is measured
+on the local monotonic clock from the time the tick was received, so it does not depend on the clock of the exchange.
+Ticks of raw_time quotes are handed out with datetime time and exchange_time like every other tick, converted on
+first read.
+"""
+import copy
+import time
+
+from .timeparse import to_datetime
+
+
+class LastTickCache:
+    def __init__(self):
+        self.ticks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, tick):
+        self.ticks[tick.contract] = tick, time.monotonic()
+
+    def age(self, contract):
+        """
+        :return: seconds since the last tick of contract was received, None if there is none
+        """
+        item = self.ticks.get(contract)
+        if item is None:
+            return None
+        return time.monotonic() - item[1]
+
+    def peek(self, contract, max_age=None):
+        """
+        :param contract:
+        :param max_age: seconds, older ticks are treated as missing
+        :return: Tick or None
+        """
+        item = self.ticks.get(contract)
+        if item is None or (max_age is not None and time.monotonic() - item[1] > max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        tick = item[0]
+        if isinstance(tick.time, float):
+            tick = self._normalized(tick)
+            self.ticks[contract] = tick, item[1]
+        return tick
+
+    @staticmethod
+    def _normalized(tick):
+        tick = copy.copy(tick)
+        tick.time = to_datetime(tick.time)
+        if isinstance(tick.exchange_time, float):
+            tick.exchange_time = to_datetime(tick.exchange_time)
+        return tick
+
+    def discard(self, contract):
+        self.ticks.pop(contract, None)
+
+    def clear(self):
+        self.ticks = {}
+
+    def __contains__(self, contract):
+        return contract in self.ticks
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+last_ticks = LastTickCache()
@@ -0,0 +1,139 @@
+"""
+fast parsing of the time formats pushed by 1token: epoch numbers and ISO-8601 strings
+
+    2019-03-13T09:31:26.123456+08:00
+    2019-03-13T09:31:26.123Z
+    1552440686.123 / 1552440686123 (milliseconds) / 1552440686123456 (microseconds)
+
+ISO strings share a small cache keyed by the second prefix and the offset, so only the fraction is parsed per
+message. Anything else falls back to arrow.
+"""
+from datetime import datetime, timedelta, timezone
+
+import arrow
+
+CACHE_SIZE = 4096
+
+# 'YYYY-MM-DDTHH:MM:SS' + offset -> (datetime of that second, epoch of that second)
+_seconds = {}
+_offsets = {'': timezone.utc, 'Z': timezone.utc, '+00:00': timezone.utc}
+
+
+def _offset(tz):
+    if tz not in _offsets:
+        sign = -1 if tz[0] == '-' else 1
+        hh, mm = (tz[1:3], tz[4:6]) if ':' in tz else (tz[1:3], tz[3:5])
+        _offsets[tz] = timezone(sign * timedelta(hours=int(hh), minutes=int(mm)))
+    return _offsets[tz]
+
+
+def _split_iso(value):
+    """
+    :return: (cache key, microsecond) or None if not in the pushed format
+    """
+    if len(value) < 19 or value[4] != '-' or value[10] not in 'T ' or value[16] != ':':
+        return None
+    rest = value[19:]
+    micro = 0
+    if rest[:1] == '.':
+        end = 1
+        while end < len(rest) and rest[end].isdigit():
+            end += 1
+        frac = rest[1:end]
+        micro = int(frac[:6].ljust(6, '0')) if frac else 0
+        rest = rest[end:]
+    return value[:19] + rest, micro
+
+
+def _second(key):
+    base = _seconds.get(key)
+    if base is None:
+        if len(_seconds) >= CACHE_SIZE:
+            _seconds.clear()
+        tz = _offset(key[19:])
+        dt = datetime(int(key[0:4]), int(key[5:7]), int(key[8:10]),
+                      int(key[11:13]), int(key[14:16]), int(key[17:19]), tzinfo=tz)
+        base = dt, dt.timestamp()
+        _seconds[key] = base
+    return base
+
+
+def _epoch_seconds(value):
+    # same normalization as arrow for millisecond / microsecond timestamps
+    if value > 1e14:
+        return value / 1e6
+    if value > 1e11:
+        return value / 1e3
+    return value
+
+
+def parse_datetime(value, default_tz=timezone.utc):
+    """
+    :param value: epoch number, ISO-8601 string, datetime or arrow.Arrow
+    :param default_tz: zone of strings without offset, None keeps them naive like dateutil.parser.parse
+    :return: datetime, timezone aware unless default_tz is None and the string has no offset
+    """
+    if isinstance(value, str):
+        split = _split_iso(value)
+        if split is not None:
+            key, micro = split
+            try:
+                dt = _second(key)[0].replace(microsecond=micro)
+            except ValueError:
+                pass
+            else:
+                if len(key) == 19 and default_tz is not timezone.utc:
+                    return dt.replace(tzinfo=default_tz)
+                return dt
+        if default_tz is not timezone.utc:
+            try:
+                dt = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+            else:
+                return dt if dt.tzinfo is not None or default_tz is None else dt.replace(tzinfo=default_tz)
+        return arrow.get(value).datetime
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(_epoch_seconds(value), timezone.utc)
+    if isinstance(value, arrow.Arrow):
+        return value.datetime
+    if isinstance(value, datetime):
+        return value
+    return arrow.get(value).datetime
+
+
+def to_datetime(value):
+    """
+    datetime of a time kept as epoch float (raw_time), arrow or datetime
+    """
+    if isinstance(value, datetime):
+        return value
+    return parse_datetime(value)
+
+
+def parse_epoch(value):
+    """
+    :param value: epoch number, ISO-8601 string, datetime or arrow.Arrow
+    :return: epoch seconds as float
+    """
+    if isinstance(value, (int, float)):
+        return float(_epoch_seconds(value))
+    if isinstance(value, str):
+        split = _split_iso(value)
+        if split is not None:
+            key, micro = split
+            try:
+                return _second(key)[1] + micro / 1e6
+            except ValueError:
+                pass
+        return arrow.get(value).float_timestamp
+    return parse_datetime(value).timestamp()
+
+
+def parse_time(value, raw=False):
+    """
+    parse_epoch if raw else parse_datetime
+    """
+    if raw:
+        return parse_epoch(value)
+    return parse_datetime(value)
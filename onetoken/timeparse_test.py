@@ -0,0 +1,63 @@
+import arrow
+import pytest
+
+from . import timeparse
+
+
+@pytest.mark.parametrize('value', [
+    '2019-03-13T09:31:26.123456+08:00',
+    '2019-03-13T09:31:26.123+08:00',
+    '2019-03-13T09:31:26+08:00',
+    '2019-03-13T09:31:26.5Z',
+    '2019-03-13T01:31:26.000001+00:00',
+    '2019-03-13T09:31:26.123456-0330',
+    '2019-03-13T09:31:26.123456',
+    1552440686.123,
+    1552440686,
+    1552440686123,
+])
+def test_parse_same_as_arrow(value):
+    expect = arrow.get(value)
+    assert timeparse.parse_datetime(value) == expect.datetime
+    assert timeparse.parse_datetime(value).utcoffset() == expect.utcoffset()
+    assert timeparse.parse_epoch(value) == pytest.approx(expect.float_timestamp, abs=1e-6)
+
+
+def test_cache_reused_across_fractions():
+    a = timeparse.parse_datetime('2019-03-13T09:31:27.1+08:00')
+    b = timeparse.parse_datetime('2019-03-13T09:31:27.2+08:00')
+    assert (b - a).total_seconds() == pytest.approx(0.1)
+    assert timeparse.parse_time('2019-03-13T09:31:27.2+08:00', raw=True) == pytest.approx(b.timestamp())
+
+
+@pytest.mark.parametrize('value', [
+    '2019-03-13T09:31:26.123456+08:00',
+    '2019-03-13T09:31:26.5Z',
+    '2019-03-13T09:31:26.123456',
+    '2019-03-13T09:31:26',
+])
+def test_order_times_same_as_dateutil(value):
+    from dateutil import parser
+    from .model import Order
+    dct = {'contract': 'okex/btc.usdt', 'entrust_price': 1, 'bs': 'b', 'entrust_amount': 1, 'entrust_time': value,
+           'account': 'okex/demo', 'last_update': value, 'exchange_oid': 'e1', 'client_oid': 'c1',
+           'status': 'pending', 'version': 1}
+    order = Order.from_dict(dct)
+    expect = parser.parse(value)
+    assert order.entrust_time == expect and order.last_update == expect
+    assert order.entrust_time.utcoffset() == expect.utcoffset()
+
+
+def test_raw_time_tick_round_trip():
+    from .model import Tick
+    dct = {'contract': 'okex/btc.usdt', 'time': '2019-03-13T09:31:26.123456+08:00',
+           'exchange_time': '2019-03-13T09:31:26.1+08:00', 'last': 1.5, 'volume': 2,
+           'bids': [{'price': 1.4, 'volume': 1}], 'asks': [{'price': 1.6, 'volume': 1}]}
+    raw = Tick.from_dict(dct, raw_time=True)
+    tick = Tick.from_dict(dct)
+    dumped = raw.to_dict()
+    assert timeparse.parse_time(dumped['time'], raw=True) == pytest.approx(raw.time, abs=1e-6)
+    assert timeparse.parse_datetime(dumped['exchange_time']) == tick.exchange_time
+    assert raw.to_short_list() == tick.to_short_list()
+    assert Tick.from_short_list(raw.to_short_list()).time == tick.time
+    assert raw.to_ws_str() == tick.to_ws_str()